@@ -0,0 +1,103 @@
+"""
+Author image assignment in /distribute/distribute-urls at 50k stories x 200k images:
+the original per-story iterrows scan against the vectorized assign_author_images.
+
+    python -m benchmarks.bench_distribute [--stories 50000] [--images 200000] [--loop-sample 1000]
+
+The per-story loop is O(stories x images), so by default it is timed on a sample of
+stories and extrapolated; pass --loop-sample 0 to run it over every story.
+Pure pandas on synthetic data; no database is needed.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.distribute import RESIZE_COLUMNS, assign_author_images
+
+
+def make_inputs(n_stories, n_images, n_authors=5000, seed=7):
+    rng = np.random.default_rng(seed)
+    authors = np.array([f"Author Number {i}" for i in range(n_authors)], dtype=object)
+
+    paragraph_df = pd.DataFrame({
+        "batch_custom_id": [f"story-{i}" for i in range(n_stories)],
+        **{f"s{i}paragraph1": "A quote about patience." for i in range(2, 10)},
+        "author_name": rng.choice(authors, n_stories),
+        "storytitle": "Title",
+        "metadescription": "Description",
+        "metakeywords": "keywords",
+    })
+    paragraph_df["author_key"] = paragraph_df["author_name"].str.replace(" ", "_").str.strip()
+
+    image_authors = pd.Series(rng.choice(authors, n_images)).str.replace(" ", "_")
+    resize_df = pd.DataFrame({
+        "author": image_authors,
+        "alttxt": [f"alt {i}" for i in range(n_images)],
+        **{col: [f"https://media.suvichaar.org/{col}/{i}" for i in range(n_images)] for col in RESIZE_COLUMNS},
+    })
+    return paragraph_df, resize_df
+
+
+def assign_loop(paragraph_df, resize_df):
+    """The per-story scan distribute_urls used before it was vectorized."""
+    resize_df = resize_df.assign(author=resize_df["author"].str.strip())
+    output_rows = []
+
+    for _, row in paragraph_df.iterrows():
+        author_key = row["author_key"]
+        author_images = resize_df[resize_df["author"] == author_key].reset_index(drop=True)
+        total_imgs = len(author_images)
+        if total_imgs == 0:
+            continue
+
+        combined = row.drop("author_key").to_dict()
+        for i in range(2, 10):
+            img_idx = (i - 2) % total_imgs
+            for col in RESIZE_COLUMNS:
+                combined[f"{col}{i}"] = author_images.at[img_idx, col]
+            combined[f"s{i}alt1"] = author_images.at[img_idx, 'alttxt']
+
+        for col in RESIZE_COLUMNS[:-1]:
+            combined[col] = author_images.at[0, col]
+        combined["s1image1"] = author_images.at[0, 'standardurl']
+        combined["s1alt1"] = author_images.at[0, 'alttxt']
+        combined["video_data_status"] = False
+        output_rows.append(combined)
+
+    return pd.DataFrame(output_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stories", type=int, default=50_000)
+    parser.add_argument("--images", type=int, default=200_000)
+    parser.add_argument("--loop-sample", type=int, default=1000)
+    args = parser.parse_args()
+
+    paragraph_df, resize_df = make_inputs(args.stories, args.images)
+
+    start = time.perf_counter()
+    vector_rows, waiting = assign_author_images(paragraph_df, resize_df)
+    vector_seconds = time.perf_counter() - start
+
+    sample = paragraph_df if not args.loop_sample else paragraph_df.head(args.loop_sample)
+    start = time.perf_counter()
+    loop_rows = assign_loop(sample, resize_df)
+    loop_seconds = (time.perf_counter() - start) * len(paragraph_df) / len(sample)
+
+    # Same images in the same slots for the sampled stories
+    compared = vector_rows.head(len(loop_rows))[loop_rows.columns].reset_index(drop=True)
+    assert compared.equals(loop_rows), "vectorized assignment differs from the loop"
+
+    print(f"{args.stories:,} stories x {args.images:,} images -> {len(vector_rows):,} rows "
+          f"({len(waiting):,} waiting for images)")
+    loop_label = "python loop" + ("" if len(sample) == len(paragraph_df) else f" (extrapolated from {len(sample):,})")
+    print(f"  {loop_label:<40} {loop_seconds:9.2f}s  {args.stories / loop_seconds:12,.0f} stories/sec")
+    print(f"  {'vectorized':<40} {vector_seconds:9.2f}s  {args.stories / vector_seconds:12,.0f} stories/sec")
+    print(f"  {'speedup':<40} {loop_seconds / vector_seconds:9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
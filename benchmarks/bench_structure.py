@@ -0,0 +1,107 @@
+"""
+Structured rows/sec of the structuring step (/generate/structure) at 100k pending quotes:
+the original per-group Python loop against the vectorized build_structured_rows.
+
+    python -m benchmarks.bench_structure [--quotes 100000] [--repeat 3]
+
+Pure pandas on synthetic data; no database is needed.
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from routers.structure import STRUCTURE_COLUMNS, build_structured_rows
+
+
+def make_pending_quotes(n_quotes, n_scrapes=20, n_authors=400, seed=7):
+    rng = np.random.default_rng(seed)
+    scrape_ids = [str(uuid.UUID(int=int(rng.integers(1 << 62)))) for _ in range(n_scrapes)]
+    authors = [f"Author Number {i}" for i in range(n_authors)]
+    return pd.DataFrame({
+        "id": np.arange(1, n_quotes + 1),
+        "text_structure_id": rng.choice(scrape_ids, n_quotes),
+        "quote": [f"Quote {i} about patience, courage and the long road ahead." for i in range(n_quotes)],
+        "author_name": rng.choice(authors, n_quotes),
+    })
+
+
+def build_rows_loop(df):
+    """The grouping loop /generate/structure used before it was vectorized."""
+    used_quotes = set()
+    grouped = []
+    unique_batches = list(df["text_structure_id"].unique())
+    batch_task_ids = {
+        batch_id: f"{batch_id[:8]}-t{i+1}" for i, batch_id in enumerate(unique_batches)
+    }
+
+    for (batch_id, author), group in df.groupby(["text_structure_id", "author_name"]):
+        quotes = group["quote"].dropna().tolist()
+        task_id = batch_task_ids[batch_id]
+        author_clean = author.replace(" ", "-")
+        author_counter = 1
+
+        for i in range(0, len(quotes), 8):
+            chunk = quotes[i:i + 8]
+            chunk += ['NA'] * (8 - len(chunk))
+            if "NA" in chunk:
+                continue
+            used_quotes.update(chunk)
+
+            group_index = i // 8 + 1
+            grouped.append({
+                "text_structure_id": batch_id,
+                "batch_custom_id": f"{batch_id[:8]}-{group_index}-{author_clean}-{author_counter}",
+                "s2paragraph1": chunk[0], "s3paragraph1": chunk[1], "s4paragraph1": chunk[2],
+                "s5paragraph1": chunk[3], "s6paragraph1": chunk[4], "s7paragraph1": chunk[5],
+                "s8paragraph1": chunk[6], "s9paragraph1": chunk[7],
+                "author_name": author,
+                "batch_type": "Auto",
+                "batch_task_id": task_id,
+                "timestamp": datetime.utcnow(),
+                "batch_created": False
+            })
+            author_counter += 1
+
+    return pd.DataFrame(grouped), used_quotes
+
+
+def best_of(fn, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quotes", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_pending_quotes(args.quotes)
+    loop_seconds, (loop_rows, _) = best_of(build_rows_loop, df, args.repeat)
+    vector_seconds, (vector_rows, used_ids) = best_of(build_structured_rows, df, args.repeat)
+
+    # Same rows with the same contents (timestamps are taken at call time)
+    compared = [column for column in STRUCTURE_COLUMNS if column != "timestamp"]
+    pd.testing.assert_frame_equal(
+        loop_rows[compared].sort_values("batch_custom_id").reset_index(drop=True),
+        vector_rows[compared].sort_values("batch_custom_id").reset_index(drop=True),
+    )
+    assert len(used_ids) == 8 * len(vector_rows)
+
+    print(f"{args.quotes:,} pending quotes -> {len(vector_rows):,} structured rows")
+    for label, seconds in (("python loop", loop_seconds), ("vectorized", vector_seconds)):
+        print(f"  {label:<12} {seconds:8.3f}s  {len(vector_rows) / seconds:12,.0f} rows/sec"
+              f"  ({args.quotes / seconds:,.0f} quotes/sec)")
+    print(f"  speedup      {loop_seconds / vector_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
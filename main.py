@@ -1,4 +1,9 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from services.db import init_pool, close_pool, pool_stats
+from services.azure_client import close_azure_client
+from services.batch_poller import start_batch_poller, stop_batch_poller
+from services.jobs import shutdown_jobs
 
 # ✅ Import all routers
 from routers import (
@@ -16,10 +21,26 @@ from routers import (
     video_meta,
     remove,
     rotate,
-    reorder
+    reorder,
+    pipeline,
+    jobs
 )
 
-app = FastAPI(title="Quote MCP Server")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ✅ One shared PostgreSQL pool for every router and service
+    init_pool()
+    # ✅ Background poller ingests Azure batches as they finish (BATCH_POLLER_ENABLED)
+    start_batch_poller()
+    yield
+    stop_batch_poller()
+    shutdown_jobs()
+    close_azure_client()
+    close_pool()
+
+
+app = FastAPI(title="Quote MCP Server", lifespan=lifespan)
 
 # ✅ Register all routers with organized prefixes and tags
 app.include_router(quotes.router, prefix="/quotes", tags=["Quotes"])
@@ -37,7 +58,13 @@ app.include_router(remove.router, prefix="/modify_column", tags=["Column Modific
 app.include_router(metadata.router, prefix="/metadata", tags=["Metadata Generator"])
 app.include_router(rotate.router, prefix="/rotate", tags=["Rotate Meta Data"])
 app.include_router(reorder.router, prefix="/reorder", tags=["Final Quote Fancy Data"])
+app.include_router(pipeline.router, prefix="/pipeline", tags=["Pipeline"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
 @app.get("/")
 def root():
     return {"message": "MCP Server is running"}
 
+@app.get("/db/pool-stats")
+def db_pool_stats():
+    return {"status": "success", **pool_stats()}
+
@@ -5,6 +5,6 @@ from services.alttxtmatch import match_alttxt_and_store
 router = APIRouter()
 
 @router.post("/match-alt-text")
-def run_alttxt_matching():
-    result = match_alttxt_and_store()
+def run_alttxt_matching(full_rescan: bool = False):
+    result = match_alttxt_and_store(full_rescan=full_rescan)
     return result
\ No newline at end of file
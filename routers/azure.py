@@ -1,11 +1,24 @@
 from fastapi import APIRouter, HTTPException
 from services.azure_batch import generate_and_upload_batch
+from routers.jobs import run_or_queue
+from services.db import get_db_connection
+from services.llm_cache import ensure_cache_tables, cache_stats
 
 router = APIRouter()
 
 @router.post("/submit-batch")
-def submit_azure_batch():
+def submit_azure_batch(wait: bool = False):
+    return run_or_queue("azure_submit", generate_and_upload_batch, wait=wait)
+
+@router.get("/cache-stats")
+def llm_cache_stats():
     try:
-        return generate_and_upload_batch()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            ensure_cache_tables(cur)
+            conn.commit()
+            stats = cache_stats(cur)
+            cur.close()
+        return {"status": "success", "cache": stats}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
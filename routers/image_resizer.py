@@ -1,12 +1,34 @@
 import os
 from fastapi import APIRouter
 from services.resizer import generate_resized_urls
+from services.cdn_warmer import warm_resized_urls
+from routers.jobs import run_or_queue
 
 router = APIRouter()
-@router.post("/generate-resized-urls")
-def trigger_resized_url_generation():
+
+def run_resize_and_warm(warm=False):
     try:
         result = generate_resized_urls()
-        return {"status": "success", **result}
+        response = {"status": "success", **result}
+        if warm:
+            response["cdn_warm"] = warm_resized_urls()
+        return response
     except Exception as e:
         return {"status": "error", "detail": str(e)}
+
+def run_cdn_warm(limit=None):
+    try:
+        return warm_resized_urls(limit)
+    except Exception as e:
+        return {"status": "error", "detail": str(e)}
+
+@router.post("/generate-resized-urls")
+def trigger_resized_url_generation(warm: bool = False, wait: bool = False):
+    if warm:
+        # Warm-up takes minutes, so it runs as a job like the other long stages
+        return run_or_queue("resize_and_warm", run_resize_and_warm, True, wait=wait)
+    return run_resize_and_warm()
+
+@router.post("/warm")
+def trigger_cdn_warm(limit: int = None, wait: bool = False):
+    return run_or_queue("cdn_warm", run_cdn_warm, limit, wait=wait)
@@ -1,13 +1,17 @@
 import os
 from fastapi import APIRouter
 from services.image_downloader import download_and_upload_author_images
+from routers.jobs import run_or_queue
 
 router = APIRouter()
 
-@router.post("/batch-author-images")
-def trigger_batch_image_upload():
+def run_batch_image_upload():
     try:
         result = download_and_upload_author_images()
         return {"status": "success", **result}
     except Exception as e:
         return {"status": "error", "detail": str(e)}
+
+@router.post("/batch-author-images")
+def trigger_batch_image_upload(wait: bool = False):
+    return run_or_queue("images", run_batch_image_upload, wait=wait)
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from services.jobs import get_job_manager, submit_job, JobQueueFull, JobConflict
+
+router = APIRouter()
+
+
+def run_or_queue(name, fn, *args, wait=False, kind="io", **kwargs):
+    """
+    Shared by the long-running stage endpoints: run inline when `wait` is set,
+    otherwise queue a job and answer 202 with its id.
+    """
+    if wait:
+        return fn(*args, **kwargs)
+    try:
+        job = submit_job(name, fn, *args, kind=kind, **kwargs)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except JobConflict as e:
+        # The caller's arguments were not applied; point them at the job that is running instead
+        raise HTTPException(status_code=409, detail={
+            "message": str(e),
+            "job_id": e.job["id"],
+            "job_status": e.job["status"],
+            "status_url": f"/jobs/{e.job['id']}"
+        })
+    return JSONResponse(status_code=202, content=jsonable_encoder({
+        "status": "accepted",
+        "job_id": job["id"],
+        "job_status": job["status"],
+        "status_url": f"/jobs/{job['id']}"
+    }))
+
+
+@router.get("/")
+def list_jobs(limit: int = 50):
+    return {"status": "success", "jobs": jsonable_encoder(get_job_manager().list(limit))}
+
+
+@router.get("/stats")
+def job_pool_stats():
+    return {"status": "success", **get_job_manager().stats()}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "success", "job": jsonable_encoder(job)}
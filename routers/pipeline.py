@@ -0,0 +1,27 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from services.pipeline import run_pipeline, list_pipeline_runs, get_pipeline_run
+from routers.jobs import run_or_queue
+
+router = APIRouter()
+
+
+@router.post("/run")
+def run_full_pipeline(force: bool = False, max_parallel: Optional[int] = None, wait: bool = False):
+    return run_or_queue("pipeline", run_pipeline, force=force, max_parallel=max_parallel, wait=wait)
+
+
+@router.get("/runs")
+def pipeline_run_history(limit: int = 20):
+    try:
+        return {"status": "success", "runs": list_pipeline_runs(limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/runs/{run_id}")
+def pipeline_run_detail(run_id: str):
+    run = get_pipeline_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Pipeline run not found")
+    return {"status": "success", **run}
@@ -1,17 +1,26 @@
+from typing import Optional
 from fastapi import APIRouter
 from services.quote_scraper import save_quotes_to_postgres_from_links
-import psycopg2
-import os
+from services.db import get_db_connection
+from routers.jobs import run_or_queue
 
 router = APIRouter()
 
-@router.post("/scrape-from-db")
-def scrape_from_db_pages():
+def run_scrape(batch_size=15, max_workers=None, requests_per_second=None, revisit=False,
+               parser_backend=None, parse_processes=None):
     try:
-        save_quotes_to_postgres_from_links()
+        result = save_quotes_to_postgres_from_links(
+            batch_size=batch_size,
+            max_workers=max_workers,
+            requests_per_second=requests_per_second,
+            revisit=revisit,
+            parser_backend=parser_backend,
+            parse_processes=parse_processes
+        )
         return {
             "status": "success",
-            "message": "Quotes scraped and saved from qoutefancy_page_links."
+            "message": "Quotes scraped and saved from qoutefancy_page_links.",
+            **result
         }
     except Exception as e:
         return {
@@ -19,25 +28,56 @@ def scrape_from_db_pages():
             "message": str(e)
         }
 
-@router.get("/count")
-def get_quote_count():
+@router.post("/scrape-from-db")
+def scrape_from_db_pages(batch_size: int = 15, max_workers: Optional[int] = None,
+                         requests_per_second: Optional[float] = None, revisit: bool = False,
+                         parser_backend: Optional[str] = None, parse_processes: Optional[int] = None,
+                         wait: bool = False):
+    return run_or_queue(
+        "scrape", run_scrape, batch_size=batch_size, max_workers=max_workers,
+        requests_per_second=requests_per_second, revisit=revisit,
+        parser_backend=parser_backend, parse_processes=parse_processes, wait=wait
+    )
+
+def run_reparse(batch_size=15, parser_backend=None, parse_processes=None):
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DATABASE"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            port=os.getenv("PG_PORT")
+        result = save_quotes_to_postgres_from_links(
+            batch_size=batch_size,
+            offline=True,
+            parser_backend=parser_backend,
+            parse_processes=parse_processes
         )
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM quote_scraped_data;")
-        count = cur.fetchone()[0]
-        cur.close()
-        conn.close()
         return {
             "status": "success",
-            "quote_count": count
+            "message": "Quotes re-parsed from the local page cache.",
+            **result
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
         }
+
+@router.post("/reparse-cache")
+def reparse_cached_pages(batch_size: int = 15, parser_backend: Optional[str] = None,
+                         parse_processes: Optional[int] = None, wait: bool = False):
+    return run_or_queue(
+        "reparse", run_reparse, batch_size=batch_size, parser_backend=parser_backend,
+        parse_processes=parse_processes, wait=wait, kind="cpu"
+    )
+
+@router.get("/count")
+def get_quote_count():
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM quote_scraped_data;")
+            count = cur.fetchone()[0]
+            cur.close()
+            return {
+                "status": "success",
+                "quote_count": count
+            }
     except Exception as e:
         return {
             "status": "error",
@@ -1,6 +1,5 @@
 from fastapi import APIRouter
-import os
-import psycopg2
+from services.db import get_db_connection
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -118,69 +117,62 @@ curly_to_source = {v: k for k, v in mapping.items()}
 def reorder_and_clean_data():
     try:
         # 1) Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DATABASE"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            port=os.getenv("PG_PORT")
-        )
-        cur = conn.cursor()
-
-        # 2) Read entire pre_final_stage_data
-        df = pd.read_sql_query("SELECT * FROM pre_final_stage_data;", conn)
-
-        # 3) Drop the `id` column if present
-        if "id" in df.columns:
-            df.drop(columns=["id"], inplace=True)
-
-        # 4) Construct a new DataFrame with columns exactly in final_columns order
-        new_df = pd.DataFrame()
-
-        for col in final_columns:
-            if col == "batch_custom_id":
-                # Copy directly if source exists
-                new_df["batch_custom_id"] = df["batch_custom_id"] if "batch_custom_id" in df.columns else ""
-            else:
-                # col is a curly field: find its source name
-                src = curly_to_source.get(col, None)
-
-                if src and src in df.columns:
-                    # Copy from the source column
-                    new_df[col] = df[src]
-                elif col in df.columns:
-                    # If the DataFrame already has a literal curly column, preserve it
-                    new_df[col] = df[col]
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+
+            # 2) Read entire pre_final_stage_data
+            df = pd.read_sql_query("SELECT * FROM pre_final_stage_data;", conn)
+
+            # 3) Drop the `id` column if present
+            if "id" in df.columns:
+                df.drop(columns=["id"], inplace=True)
+
+            # 4) Construct a new DataFrame with columns exactly in final_columns order
+            new_df = pd.DataFrame()
+
+            for col in final_columns:
+                if col == "batch_custom_id":
+                    # Copy directly if source exists
+                    new_df["batch_custom_id"] = df["batch_custom_id"] if "batch_custom_id" in df.columns else ""
                 else:
-                    # Otherwise, fill with empty strings
-                    new_df[col] = ""
-
-        # 5) Drop old final_quote_fancy_data if it exists, then recreate with new columns
-        cur.execute("DROP TABLE IF EXISTS final_quote_fancy_data;")
-        create_sql = (
-            "CREATE TABLE final_quote_fancy_data (\n"
-            + ",\n".join([f'"{c}" TEXT' for c in new_df.columns])
-            + "\n);"
-        )
-        cur.execute(create_sql)
-
-        # 6) Bulk‐insert all rows
-        insert_cols = ", ".join([f'"{c}"' for c in new_df.columns])
-        placeholders = ", ".join(["%s"] * len(new_df.columns))
-        insert_sql = f"INSERT INTO final_quote_fancy_data ({insert_cols}) VALUES ({placeholders});"
-        cur.executemany(insert_sql, new_df.values.tolist())
-        conn.commit()
-
-        # 7) Close connections
-        cur.close()
-        conn.close()
-
-        return {
-            "status": "success",
-            "message": "Data saved to final_quote_fancy_data",
-            "columns_saved": new_df.columns.tolist(),
-            "records": len(new_df)
-        }
+                    # col is a curly field: find its source name
+                    src = curly_to_source.get(col, None)
+
+                    if src and src in df.columns:
+                        # Copy from the source column
+                        new_df[col] = df[src]
+                    elif col in df.columns:
+                        # If the DataFrame already has a literal curly column, preserve it
+                        new_df[col] = df[col]
+                    else:
+                        # Otherwise, fill with empty strings
+                        new_df[col] = ""
+
+            # 5) Drop old final_quote_fancy_data if it exists, then recreate with new columns
+            cur.execute("DROP TABLE IF EXISTS final_quote_fancy_data;")
+            create_sql = (
+                "CREATE TABLE final_quote_fancy_data (\n"
+                + ",\n".join([f'"{c}" TEXT' for c in new_df.columns])
+                + "\n);"
+            )
+            cur.execute(create_sql)
+
+            # 6) Bulk‐insert all rows
+            insert_cols = ", ".join([f'"{c}"' for c in new_df.columns])
+            placeholders = ", ".join(["%s"] * len(new_df.columns))
+            insert_sql = f"INSERT INTO final_quote_fancy_data ({insert_cols}) VALUES ({placeholders});"
+            cur.executemany(insert_sql, new_df.values.tolist())
+            conn.commit()
+
+            # 7) Close connections
+            cur.close()
+
+            return {
+                "status": "success",
+                "message": "Data saved to final_quote_fancy_data",
+                "columns_saved": new_df.columns.tolist(),
+                "records": len(new_df)
+            }
 
     except Exception as e:
         return {"status": "error", "detail": str(e)}
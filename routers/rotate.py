@@ -1,8 +1,7 @@
 # routers/rotate.py
 
 from fastapi import APIRouter
-import os
-import psycopg2
+from services.db import get_db_connection
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -37,57 +36,50 @@ def add_circular_navigation_fields(df):
 @router.post("/")
 def rotate_meta_data():
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DATABASE"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            port=os.getenv("PG_PORT")
-        )
-        cur = conn.cursor()
-
-        # 1) Read meta_data into DataFrame
-        df = pd.read_sql_query("SELECT * FROM meta_data;", conn)
-
-        # 2) Drop original ID column if present
-        if "id" in df.columns:
-            df.drop(columns=["id"], inplace=True)
-
-        # 3) Clean ALT text columns by removing leading "ALT text:" prefix and any surrounding quotes
-        alt_cols = ["s1alt1", "s2alt1", "s3alt1", "s4alt1", "s5alt1", "s6alt1", "s7alt1", "s8alt1", "s9alt1"]
-        for col in alt_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(r'^ALT text:\s*', "", regex=True).str.strip('"')
-
-        # 4) Add circular navigation fields
-        df = add_circular_navigation_fields(df)
-
-        # 5) Drop pre_existing table if exists, then create pre_final_stage_data
-        cur.execute("DROP TABLE IF EXISTS pre_final_stage_data;")
-        create_table_sql = (
-            "CREATE TABLE pre_final_stage_data ("
-            + ", ".join([f'"{col}" TEXT' for col in df.columns])
-            + ", id SERIAL PRIMARY KEY"
-            + ");"
-        )
-        cur.execute(create_table_sql)
-
-        # 6) Bulk‐insert rotated (and cleaned) data into the newly‐created table
-        insert_cols = list(df.columns)
-        insert_sql = f"""
-            INSERT INTO pre_final_stage_data (
-                {', '.join([f'"{col}"' for col in insert_cols])}
-            ) VALUES (
-                {', '.join(['%s'] * len(insert_cols))}
-            );
-        """
-        cur.executemany(insert_sql, df[insert_cols].values.tolist())
-        conn.commit()
-
-        cur.close()
-        conn.close()
-
-        return {"status": "success", "records_rotated": len(df)}
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+
+            # 1) Read meta_data into DataFrame
+            df = pd.read_sql_query("SELECT * FROM meta_data;", conn)
+
+            # 2) Drop original ID column if present
+            if "id" in df.columns:
+                df.drop(columns=["id"], inplace=True)
+
+            # 3) Clean ALT text columns by removing leading "ALT text:" prefix and any surrounding quotes
+            alt_cols = ["s1alt1", "s2alt1", "s3alt1", "s4alt1", "s5alt1", "s6alt1", "s7alt1", "s8alt1", "s9alt1"]
+            for col in alt_cols:
+                if col in df.columns:
+                    df[col] = df[col].astype(str).str.replace(r'^ALT text:\s*', "", regex=True).str.strip('"')
+
+            # 4) Add circular navigation fields
+            df = add_circular_navigation_fields(df)
+
+            # 5) Drop pre_existing table if exists, then create pre_final_stage_data
+            cur.execute("DROP TABLE IF EXISTS pre_final_stage_data;")
+            create_table_sql = (
+                "CREATE TABLE pre_final_stage_data ("
+                + ", ".join([f'"{col}" TEXT' for col in df.columns])
+                + ", id SERIAL PRIMARY KEY"
+                + ");"
+            )
+            cur.execute(create_table_sql)
+
+            # 6) Bulk‐insert rotated (and cleaned) data into the newly‐created table
+            insert_cols = list(df.columns)
+            insert_sql = f"""
+                INSERT INTO pre_final_stage_data (
+                    {', '.join([f'"{col}"' for col in insert_cols])}
+                ) VALUES (
+                    {', '.join(['%s'] * len(insert_cols))}
+                );
+            """
+            cur.executemany(insert_sql, df[insert_cols].values.tolist())
+            conn.commit()
+
+            cur.close()
+
+            return {"status": "success", "records_rotated": len(df)}
 
     except Exception as e:
         return {"status": "error", "message": str(e)}
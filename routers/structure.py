@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException
+from routers.jobs import run_or_queue
 import pandas as pd
-import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+from services.db import get_db_connection
 import uuid
 import os
 from dotenv import load_dotenv
@@ -9,129 +12,342 @@ from datetime import datetime
 router = APIRouter()
 load_dotenv()
 
-@router.post("/structure")
-def structure_quotes_clean_na():
-    try:
-        conn = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DATABASE"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            port=os.getenv("PG_PORT")
-        )
-        cur = conn.cursor()
+SLOT_COLUMNS = [f"s{i}paragraph1" for i in range(2, 10)]
+STRUCTURE_COLUMNS = [
+    "text_structure_id", "batch_custom_id", *SLOT_COLUMNS,
+    "author_name", "batch_type", "batch_task_id", "timestamp", "batch_created"
+]
+
+
+def build_structured_rows(df):
+    """
+    Chunk each (text_structure_id, author_name) group into rows of 8 quotes.
+    Incomplete trailing chunks are dropped. Returns (rows DataFrame, ids of the used quotes).
+    """
+    # Assign t1, t2, t3... in order of first appearance
+    codes, _ = pd.factorize(df["text_structure_id"])
+    df = df.assign(task_number=codes + 1)
+
+    df = df.sort_values(["text_structure_id", "author_name"], kind="stable")
+    position = df.groupby(["text_structure_id", "author_name"], sort=False).cumcount()
+    df = df.assign(chunk=position // 8, slot=position % 8)
+
+    chunk_size = df.groupby(["text_structure_id", "author_name", "chunk"], sort=False)["quote"].transform("size")
+    full = df[chunk_size == 8]
+    if full.empty:
+        return pd.DataFrame(columns=STRUCTURE_COLUMNS), []
+
+    wide = (
+        full.set_index(["text_structure_id", "author_name", "chunk", "task_number", "slot"])["quote"]
+        .unstack("slot")
+        .rename(columns=dict(enumerate(SLOT_COLUMNS)))
+        .rename_axis(columns=None)
+        .reset_index()
+    )
+
+    group_index = (wide["chunk"] + 1).astype(str)
+    batch_prefix = wide["text_structure_id"].astype(str).str[:8]
+    wide["batch_custom_id"] = (
+        batch_prefix + "-" + group_index + "-" + wide["author_name"].str.replace(" ", "-") + "-" + group_index
+    )
+    wide["batch_task_id"] = batch_prefix + "-t" + wide["task_number"].astype(str)
+    wide["batch_type"] = "Auto"
+    wide["timestamp"] = datetime.utcnow()
+    wide["batch_created"] = False
+
+    return wide[STRUCTURE_COLUMNS], full["id"].tolist()
+
+
+def ensure_structure_schema(cur):
+    # quote_scraped_data is written by concurrent scrapes: only issue DDL on it when something
+    # is missing, since ALTER (ACCESS EXCLUSIVE) and CREATE INDEX (SHARE) lock it even as no-ops
+    cur.execute("""
+        SELECT
+            EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'quote_scraped_data' AND column_name = 'quote_length'
+            ),
+            EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_quote_scraped_pending_structure'),
+            EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_quote_scraped_waiting_author');
+    """)
+    has_length, has_pending_index, has_waiting_index = cur.fetchone()
 
+    if not has_length:
+        # Length is computed by Postgres so oversized quotes never leave the database
         cur.execute("""
-            SELECT text_structure_id, quote, author_name
-            FROM quote_scraped_data
+            ALTER TABLE quote_scraped_data
+            ADD COLUMN IF NOT EXISTS quote_length INTEGER
+            GENERATED ALWAYS AS (char_length(btrim(quote, E' \\t\\r\\n'))) STORED;
+        """)
+    if not has_pending_index:
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_quote_scraped_pending_structure
+            ON quote_scraped_data (text_structure_id, author_name, id)
             WHERE text_structure_status = 'Pending';
         """)
-        rows = cur.fetchall()
+    if not has_waiting_index:
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_quote_scraped_waiting_author
+            ON quote_scraped_data (author_name)
+            WHERE text_structure_status = 'Waiting';
+        """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS structure_waiting_authors (
+            author_name TEXT PRIMARY KEY,
+            waiting_count INTEGER DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS template1_text_structure_data (
+            id SERIAL PRIMARY KEY,
+            text_structure_id UUID,
+            batch_custom_id TEXT,
+            s2paragraph1 TEXT,
+            s3paragraph1 TEXT,
+            s4paragraph1 TEXT,
+            s5paragraph1 TEXT,
+            s6paragraph1 TEXT,
+            s7paragraph1 TEXT,
+            s8paragraph1 TEXT,
+            s9paragraph1 TEXT,
+            author_name TEXT,
+            batch_type TEXT,
+            batch_task_id TEXT,
+            timestamp TIMESTAMPTZ DEFAULT NOW(),
+            batch_created BOOLEAN DEFAULT FALSE
+        );
+    """)
 
-        if not rows:
-            return {"status": "success", "message": "No pending quotes found."}
 
-        df = pd.DataFrame(rows, columns=["text_structure_id", "quote", "author_name"])
-        df = df[df["quote"].apply(lambda x: isinstance(x, str) and len(x.strip()) <= 180)]
+def write_structured_rows(cur, rows, used_ids):
+    # ✅ Single bulk insert for every structured row
+    execute_values(cur, f"""
+        INSERT INTO template1_text_structure_data ({', '.join(STRUCTURE_COLUMNS)})
+        VALUES %s;
+    """, rows, page_size=1000)
 
-        used_quotes = set()
-        grouped = []
+    # ✅ Mark used quotes by primary key
+    cur.execute("""
+        UPDATE quote_scraped_data
+        SET text_structure_status = 'Completed'
+        WHERE id = ANY(%s);
+    """, (used_ids,))
 
-        # Sort all unique text_structure_ids to assign t1, t2, t3...
-        unique_batches = list(df["text_structure_id"].unique())
-        batch_task_ids = {
-            batch_id: f"{batch_id[:8]}-t{i+1}" for i, batch_id in enumerate(unique_batches)
-        }
 
-        for (batch_id, author), group in df.groupby(["text_structure_id", "author_name"]):
-            quotes = group["quote"].dropna().tolist()
-            task_id = batch_task_ids[batch_id]
-            author_clean = author.replace(" ", "-")
-            author_counter = 1
-
-            for i in range(0, len(quotes), 8):
-                chunk = quotes[i:i + 8]
-                chunk += ['NA'] * (8 - len(chunk))
-                if "NA" in chunk:
-                    continue
-                used_quotes.update(chunk)
-
-                group_index = i // 8 + 1
-                batch_custom_id = f"{batch_id[:8]}-{group_index}-{author_clean}-{author_counter}"
-
-                grouped.append({
-                    "text_structure_id": batch_id,
-                    "batch_custom_id": batch_custom_id,
-                    "s2paragraph1": chunk[0], "s3paragraph1": chunk[1], "s4paragraph1": chunk[2],
-                    "s5paragraph1": chunk[3], "s6paragraph1": chunk[4], "s7paragraph1": chunk[5],
-                    "s8paragraph1": chunk[6], "s9paragraph1": chunk[7],
-                    "author_name": author,
-                    "batch_type": "Auto",
-                    "batch_task_id": task_id,
-                    "timestamp": datetime.utcnow(),
-                    "batch_created": False
-                })
-                author_counter += 1
-
-        if not grouped:
-            return {"status": "success", "message": "No complete 8-quote groups found."}
-
-        final_df = pd.DataFrame(grouped)
+def prepare_pending_quotes(cur):
+    """
+    Retire oversized Pending quotes and bring Waiting leftovers back only for authors
+    with new Pending quotes, moving them into that author's newest batch.
+    """
+    cur.execute("""
+        UPDATE quote_scraped_data
+        SET text_structure_status = 'Skipped'
+        WHERE text_structure_status = 'Pending' AND quote_length > 180;
+    """)
+    cur.execute("""
+        WITH arrivals AS (
+            SELECT DISTINCT ON (q.author_name) q.author_name, q.text_structure_id
+            FROM quote_scraped_data q
+            JOIN structure_waiting_authors w
+              ON w.author_name = q.author_name AND w.waiting_count > 0
+            WHERE q.text_structure_status = 'Pending'
+            ORDER BY q.author_name, q.timestamp DESC, q.id DESC
+        )
+        UPDATE quote_scraped_data q
+        SET text_structure_status = 'Pending',
+            text_structure_id = a.text_structure_id
+        FROM arrivals a
+        WHERE q.author_name = a.author_name
+          AND q.text_structure_status = 'Waiting';
+    """)
+    return cur.rowcount
+
 
+def park_leftover_quotes(cur, waiting_ids):
+    if waiting_ids:
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS template1_text_structure_data (
-                id SERIAL PRIMARY KEY,
-                text_structure_id UUID,
-                batch_custom_id TEXT,
-                s2paragraph1 TEXT,
-                s3paragraph1 TEXT,
-                s4paragraph1 TEXT,
-                s5paragraph1 TEXT,
-                s6paragraph1 TEXT,
-                s7paragraph1 TEXT,
-                s8paragraph1 TEXT,
-                s9paragraph1 TEXT,
-                author_name TEXT,
-                batch_type TEXT,
-                batch_task_id TEXT,
-                timestamp TIMESTAMPTZ DEFAULT NOW(),
-                batch_created BOOLEAN DEFAULT FALSE
-            );
+            UPDATE quote_scraped_data
+            SET text_structure_status = 'Waiting'
+            WHERE id = ANY(%s);
+        """, (waiting_ids,))
+
+
+def refresh_waiting_counts(cur, authors):
+    authors = list(authors)
+    cur.execute("""
+        UPDATE structure_waiting_authors
+        SET waiting_count = 0, updated_at = NOW()
+        WHERE author_name = ANY(%s);
+    """, (authors,))
+    cur.execute("""
+        INSERT INTO structure_waiting_authors (author_name, waiting_count, updated_at)
+        SELECT author_name, COUNT(*), NOW()
+        FROM quote_scraped_data
+        WHERE text_structure_status = 'Waiting' AND author_name = ANY(%s)
+        GROUP BY author_name
+        ON CONFLICT (author_name) DO UPDATE
+        SET waiting_count = EXCLUDED.waiting_count, updated_at = NOW();
+    """, (authors,))
+
+
+def stream_structured_groups(conn, commit_every):
+    """
+    Read Pending quotes through a server-side cursor ordered by (text_structure_id, author_name)
+    and commit complete 8-quote groups every `commit_every` rows, so memory stays flat.
+    """
+    itersize = int(os.getenv("STRUCTURE_STREAM_ITERSIZE", "5000"))
+    write_cur = conn.cursor()
+    # WITH HOLD keeps the cursor open across the incremental commits
+    read_cur = conn.cursor(name=f"structure_stream_{uuid.uuid4().hex[:8]}", withhold=True)
+    read_cur.itersize = itersize
+    try:
+        read_cur.execute("""
+            SELECT id, text_structure_id, quote, author_name
+            FROM quote_scraped_data
+            WHERE text_structure_status = 'Pending'
+            ORDER BY text_structure_id, author_name, id;
         """)
 
-        for _, row in final_df.iterrows():
-            cur.execute("""
-                INSERT INTO template1_text_structure_data (
-                    text_structure_id, batch_custom_id,
-                    s2paragraph1, s3paragraph1, s4paragraph1, s5paragraph1,
-                    s6paragraph1, s7paragraph1, s8paragraph1, s9paragraph1,
-                    author_name, batch_type, batch_task_id, timestamp, batch_created
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                row["text_structure_id"], row["batch_custom_id"],
-                row["s2paragraph1"], row["s3paragraph1"], row["s4paragraph1"], row["s5paragraph1"],
-                row["s6paragraph1"], row["s7paragraph1"], row["s8paragraph1"], row["s9paragraph1"],
-                row["author_name"], row["batch_type"], row["batch_task_id"], row["timestamp"], row["batch_created"]
+        timestamp = datetime.utcnow()
+        task_numbers = {}
+        pending_rows, pending_ids, waiting_ids = [], [], []
+        current_key, buffer, group_index = None, [], 0
+        totals = {"rows_structured": 0, "quotes_waiting": 0, "batches": set(), "authors": set(), "seen_authors": set()}
+
+        def flush():
+            if pending_rows:
+                write_structured_rows(write_cur, pending_rows, pending_ids)
+            park_leftover_quotes(write_cur, waiting_ids)
+            conn.commit()
+            pending_rows.clear()
+            pending_ids.clear()
+            waiting_ids.clear()
+
+        for quote_id, batch_id, quote, author in read_cur:
+            if author is None:
+                # Like the pandas path: quotes without an author are never grouped, only parked
+                waiting_ids.append(quote_id)
+                totals["quotes_waiting"] += 1
+                continue
+
+            if (batch_id, author) != current_key:
+                # Leftover quotes of the previous author group wait for that author's next arrivals
+                waiting_ids.extend(qid for qid, _ in buffer)
+                totals["quotes_waiting"] += len(buffer)
+                current_key, buffer, group_index = (batch_id, author), [], 0
+                task_numbers.setdefault(batch_id, len(task_numbers) + 1)
+                totals["seen_authors"].add(author)
+
+            buffer.append((quote_id, quote))
+            if len(buffer) < 8:
+                continue
+
+            group_index += 1
+            batch_prefix = str(batch_id)[:8]
+            author_clean = author.replace(" ", "-")
+            pending_rows.append((
+                batch_id, f"{batch_prefix}-{group_index}-{author_clean}-{group_index}",
+                *[q for _, q in buffer],
+                author, "Auto", f"{batch_prefix}-t{task_numbers[batch_id]}", timestamp, False
             ))
+            pending_ids.extend(qid for qid, _ in buffer)
+            buffer = []
 
-        if used_quotes:
-            placeholders = ','.join(['%s'] * len(used_quotes))
-            cur.execute(f"""
-                UPDATE quote_scraped_data
-                SET text_structure_status = 'Completed'
-                WHERE quote IN ({placeholders});
-            """, tuple(used_quotes))
+            totals["rows_structured"] += 1
+            totals["batches"].add(batch_id)
+            totals["authors"].add(author)
+            if len(pending_rows) >= commit_every:
+                flush()
 
+        waiting_ids.extend(qid for qid, _ in buffer)
+        totals["quotes_waiting"] += len(buffer)
+        flush()
+        refresh_waiting_counts(write_cur, totals["seen_authors"])
         conn.commit()
-        cur.close()
-        conn.close()
+    finally:
+        # Rollback does not close a held cursor; leave the pooled connection clean on failure too
+        if conn.info.transaction_status == extensions.TRANSACTION_STATUS_INERROR:
+            conn.rollback()
+        read_cur.close()
+        write_cur.close()
+    return totals
+
+
+def structure_quotes(stream=False, commit_every=500):
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            ensure_structure_schema(cur)
+            revived = prepare_pending_quotes(cur)
+            conn.commit()
 
-        return {
-            "status": "success",
-            "rows_structured": len(final_df),
-            "batches_created": final_df["text_structure_id"].nunique(),
-            "authors_structured": final_df["author_name"].nunique()
-        }
+            if stream:
+                totals = stream_structured_groups(conn, commit_every)
+                cur.close()
+                if not totals["rows_structured"]:
+                    return {
+                        "status": "success",
+                        "message": "No complete 8-quote groups found.",
+                        "quotes_revived": revived,
+                        "quotes_waiting": totals["quotes_waiting"]
+                    }
+                return {
+                    "status": "success",
+                    "rows_structured": totals["rows_structured"],
+                    "batches_created": len(totals["batches"]),
+                    "authors_structured": len(totals["authors"]),
+                    "quotes_revived": revived,
+                    "quotes_waiting": totals["quotes_waiting"]
+                }
+
+            cur.execute("""
+                SELECT id, text_structure_id, quote, author_name
+                FROM quote_scraped_data
+                WHERE text_structure_status = 'Pending';
+            """)
+            rows = cur.fetchall()
+
+            if not rows:
+                return {"status": "success", "message": "No pending quotes found."}
+
+            df = pd.DataFrame(rows, columns=["id", "text_structure_id", "quote", "author_name"])
+            final_df, used_ids = build_structured_rows(df)
+
+            # ✅ Park leftovers of incomplete chunks until their author gets new quotes
+            waiting_ids = df.loc[~df["id"].isin(used_ids), "id"].tolist()
+            park_leftover_quotes(cur, waiting_ids)
+            refresh_waiting_counts(cur, df["author_name"].dropna().unique().tolist())
+
+            if final_df.empty:
+                conn.commit()
+                cur.close()
+                return {
+                    "status": "success",
+                    "message": "No complete 8-quote groups found.",
+                    "quotes_revived": revived,
+                    "quotes_waiting": len(waiting_ids)
+                }
+
+            write_structured_rows(cur, final_df.values.tolist(), used_ids)
+
+            conn.commit()
+            cur.close()
+
+            return {
+                "status": "success",
+                "rows_structured": len(final_df),
+                "batches_created": final_df["text_structure_id"].nunique(),
+                "authors_structured": final_df["author_name"].nunique(),
+                "quotes_revived": revived,
+                "quotes_waiting": len(waiting_ids)
+            }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/structure")
+def structure_quotes_clean_na(stream: bool = False, commit_every: int = 500, wait: bool = False):
+    return run_or_queue("structure", structure_quotes, stream=stream, commit_every=commit_every,
+                        wait=wait, kind="cpu")
@@ -1,8 +1,33 @@
 from fastapi import APIRouter
-from services.fetch import fetch_and_store_pending_batches
+from services.fetch import fetch_and_store_pending_batches, replay_archived_batches
+from services.batch_poller import get_batch_poller
+from routers.jobs import run_or_queue
 
 router = APIRouter()
 
 @router.get("/download_jsonl_data")
-def trigger_batch_data_download():
-    return fetch_and_store_pending_batches()
\ No newline at end of file
+def trigger_batch_data_download(wait: bool = False):
+    return run_or_queue("fetch", fetch_and_store_pending_batches, wait=wait)
+
+@router.post("/replay_archive")
+def trigger_archive_replay(batch_id: str = None):
+    return replay_archived_batches(batch_id)
+
+
+@router.get("/poller")
+def batch_poller_status():
+    return {"status": "success", **get_batch_poller().status()}
+
+
+@router.post("/poller/enable")
+def enable_batch_poller():
+    poller = get_batch_poller()
+    poller.enabled = True
+    poller.start()
+    return {"status": "success", "enabled": True}
+
+
+@router.post("/poller/disable")
+def disable_batch_poller():
+    get_batch_poller().enabled = False
+    return {"status": "success", "enabled": False}
@@ -1,15 +1,19 @@
 from fastapi import APIRouter
 import os
 from services.azure_image_batch import generate_and_upload_image_alt_batch
+from routers.jobs import run_or_queue
 
 router = APIRouter()
-@router.post("/batch-image-alt")
-def trigger_batch_image_alt_upload():
+def run_batch_image_alt_upload():
     try:
         result = generate_and_upload_image_alt_batch()
         return {"status": "success", **result}
     except Exception as e:
         return {"status": "error", "detail": str(e)}
+
+@router.post("/batch-image-alt")
+def trigger_batch_image_alt_upload(wait: bool = False):
+    return run_or_queue("image_alt", run_batch_image_alt_upload, wait=wait)
 # Compare this snippet from routers/image_router.py:
 # import os
 # from fastapi import APIRouter
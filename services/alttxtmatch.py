@@ -1,90 +1,148 @@
-import os
-import psycopg2
-import pandas as pd
+from services.db import get_db_connection
+from services.batch_results import ensure_processed_tables, ensure_unique_index
+from services.author_image_index import ensure_search_rank_column
 from dotenv import load_dotenv
-from datetime import datetime
 
 load_dotenv()
 
-def match_alttxt_and_store():
-    try:
-        conn = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DATABASE"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            port=os.getenv("PG_PORT")
-        )
-        cur = conn.cursor()
+# custom_id of an image is its filename without the extension (see azure_image_batch)
+IMAGE_CUSTOM_ID_SQL = r"regexp_replace(filename, '\.[^.]*$', '')"
 
-        # ✅ Create match table if not exists
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS alttxt_match_table (
-                id SERIAL PRIMARY KEY,
-                custom_id TEXT,
-                alttxt TEXT,
-                timestamp TIMESTAMPTZ DEFAULT NOW()
-            );
-        """)
 
-        # ✅ Get image_fetched_data
-        cur.execute("SELECT id, author, filename, cdn_url, timestamp FROM image_fetched_data;")
-        image_data = cur.fetchall()
-        image_df = pd.DataFrame(image_data, columns=["image_id", "author", "filename", "cdn_url", "image_timestamp"])
-        image_df["custom_id"] = image_df["filename"].str.replace(".jpg", "", regex=False)
+def ensure_alttxt_tables(cur):
+    ensure_processed_tables(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS image_fetched_data (
+            id SERIAL PRIMARY KEY,
+            author TEXT,
+            filename TEXT,
+            cdn_url TEXT,
+            batch_task_id TEXT,
+            batch_custom_id TEXT,
+            batch_type TEXT,
+            batch_created BOOLEAN DEFAULT FALSE,
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    ensure_search_rank_column(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS alttxt_match_table (
+            id SERIAL PRIMARY KEY,
+            custom_id TEXT,
+            alttxt TEXT,
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS alttxt_processed_data (
+            id SERIAL PRIMARY KEY,
+            image_id INTEGER,
+            author TEXT,
+            filename TEXT,
+            cdn_url TEXT,
+            alttxt TEXT,
+            status_resizer BOOLEAN DEFAULT FALSE,
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    # Checked first: ALTER takes an ACCESS EXCLUSIVE lock even when the column already exists
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'alttxt_processed_data' AND column_name = 'custom_id';
+    """)
+    if not cur.fetchone():
+        cur.execute("ALTER TABLE alttxt_processed_data ADD COLUMN IF NOT EXISTS custom_id TEXT;")
+        cur.execute(f"""
+            UPDATE alttxt_processed_data
+            SET custom_id = {IMAGE_CUSTOM_ID_SQL}
+            WHERE custom_id IS NULL AND filename IS NOT NULL;
+        """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_alttxt_processed_author ON alttxt_processed_data (author);")
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_image_fetched_custom_id
+        ON image_fetched_data (({IMAGE_CUSTOM_ID_SQL}));
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_image_batch_processed_pending
+        ON image_batch_processed_data (id)
+        WHERE merged_status = 'Pending';
+    """)
+    # Rows that already went through the resizer win over their duplicates
+    ensure_unique_index(
+        cur, "uq_alttxt_processed_custom_id", "alttxt_processed_data",
+        "custom_id", "status_resizer DESC, id"
+    )
+    ensure_unique_index(cur, "uq_alttxt_match_custom_id", "alttxt_match_table", "custom_id", "id DESC")
 
-        # ✅ Get custom_id and alttxt from processed image alt table
-        cur.execute("SELECT custom_id, alttxt FROM image_batch_processed_data;")
-        alttxt_rows = cur.fetchall()
-        alttxt_df = pd.DataFrame(alttxt_rows, columns=["custom_id", "alttxt"])
 
-        # ✅ Merge & filter valid matches
-        merged_df = pd.merge(image_df, alttxt_df, on="custom_id", how="left")
-        matched_df = merged_df[merged_df["alttxt"].notna()].copy()
+def match_alttxt_and_store(full_rescan=False):
+    """
+    Join new ALT texts to their images inside Postgres. Only image_batch_processed_data rows
+    with merged_status = 'Pending' are read (all rows with `full_rescan`), so each run
+    scales with the new ALT texts rather than the whole history.
+    """
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            ensure_alttxt_tables(cur)
+            conn.commit()
 
-        # ✅ Save matched entries into alttxt_match_table
-        cur.executemany("""
-            INSERT INTO alttxt_match_table (custom_id, alttxt)
-            VALUES (%s, %s);
-        """, matched_df[["custom_id", "alttxt"]].values.tolist())
+            # ✅ Pending ALT texts joined to their image, one image per custom_id
+            cur.execute(f"""
+                CREATE TEMP TABLE alttxt_pending ON COMMIT DROP AS
+                SELECT DISTINCT ON (b.custom_id)
+                       b.id AS alt_row_id, b.custom_id, b.alttxt,
+                       i.id AS image_id, i.author, i.filename, i.cdn_url
+                FROM image_batch_processed_data b
+                JOIN image_fetched_data i
+                  ON {IMAGE_CUSTOM_ID_SQL} = b.custom_id
+                WHERE (%s OR b.merged_status = 'Pending')
+                  AND b.alttxt IS NOT NULL
+                ORDER BY b.custom_id, i.id DESC;
+            """, (full_rescan,))
+            cur.execute("SELECT COUNT(*) FROM alttxt_pending;")
+            pending = cur.fetchone()[0]
 
-        # ✅ Drop unmatched rows from alttxt_match_table
-        cur.execute("DELETE FROM alttxt_match_table WHERE alttxt = 'NA';")
+            # ✅ Save matched entries into alttxt_match_table ('NA' answers are not matches)
+            cur.execute("""
+                INSERT INTO alttxt_match_table (custom_id, alttxt, timestamp)
+                SELECT custom_id, alttxt, NOW()
+                FROM alttxt_pending
+                WHERE alttxt <> 'NA'
+                ON CONFLICT (custom_id) DO NOTHING;
+            """)
 
-        # ✅ Create final processed table with status_resizer field
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS alttxt_processed_data (
-                id SERIAL PRIMARY KEY,
-                image_id INTEGER,
-                author TEXT,
-                filename TEXT,
-                cdn_url TEXT,
-                alttxt TEXT,
-                status_resizer BOOLEAN DEFAULT FALSE,
-                timestamp TIMESTAMPTZ DEFAULT NOW()
-            );
-        """)
+            # ✅ Insert joined results into the final processed table, once per custom_id
+            cur.execute("""
+                INSERT INTO alttxt_processed_data (
+                    image_id, author, filename, cdn_url, alttxt, custom_id, status_resizer, timestamp
+                )
+                SELECT image_id, author, filename, cdn_url, alttxt, custom_id, FALSE, NOW()
+                FROM alttxt_pending
+                ON CONFLICT (custom_id) DO NOTHING;
+            """)
+            inserted = cur.rowcount
 
-        # ✅ Insert joined results into final processed table
-        insert_data = matched_df[["image_id", "author", "filename", "cdn_url", "alttxt"]].copy()
-        insert_data["status_resizer"] = False
-        insert_data["timestamp"] = datetime.utcnow()
+            # ✅ Matched ALT texts are done; unmatched ones stay Pending until their image row exists
+            cur.execute("""
+                UPDATE image_batch_processed_data b
+                SET merged_status = 'Completed'
+                FROM alttxt_pending p
+                WHERE b.id = p.alt_row_id AND b.merged_status IS DISTINCT FROM 'Completed';
+            """)
 
-        cur.executemany("""
-            INSERT INTO alttxt_processed_data (
-                image_id, author, filename, cdn_url, alttxt, status_resizer, timestamp
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s);
-        """, insert_data.values.tolist())
+            cur.execute("SELECT COUNT(*) FROM image_batch_processed_data WHERE merged_status = 'Pending';")
+            still_pending = cur.fetchone()[0]
 
-        conn.commit()
-        cur.close()
-        conn.close()
+            conn.commit()
+            cur.close()
 
-        return {
-            "status": "success",
-            "matched_rows": len(matched_df),
-            "total_checked": len(image_df)
-        }
+            return {
+                "status": "success",
+                "matched_rows": inserted,
+                "total_checked": pending,
+                "unmatched_pending": still_pending
+            }
 
     except Exception as e:
-        return {"status": "error", "detail": str(e)}
\ No newline at end of file
+        return {"status": "error", "detail": str(e)}
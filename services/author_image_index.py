@@ -0,0 +1,100 @@
+import os
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def coverage_policy():
+    return {
+        # An author with at least this many alt-texted images is covered
+        "min_count": int(os.getenv("AUTHOR_IMAGE_MIN_COUNT", "8")),
+        # Images older than this are refreshed; 0 keeps them forever
+        "max_age_days": int(os.getenv("AUTHOR_IMAGE_MAX_AGE_DAYS", "0")),
+    }
+
+
+def ensure_search_rank_column(cur):
+    # Position of the image in the author's search results (1 = top hit); NULL for legacy rows.
+    # Checked first: ALTER takes an ACCESS EXCLUSIVE lock even when the column already exists
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'image_fetched_data' AND column_name = 'search_rank';
+    """)
+    if not cur.fetchone():
+        cur.execute("ALTER TABLE image_fetched_data ADD COLUMN IF NOT EXISTS search_rank INTEGER;")
+
+
+def ensure_author_image_index(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS image_fetched_data (
+            id SERIAL PRIMARY KEY,
+            author TEXT,
+            filename TEXT,
+            cdn_url TEXT,
+            batch_task_id TEXT,
+            batch_custom_id TEXT,
+            batch_type TEXT,
+            batch_created BOOLEAN DEFAULT FALSE,
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    ensure_search_rank_column(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS author_image_index (
+            author TEXT PRIMARY KEY,
+            image_count INTEGER DEFAULT 0,
+            last_fetched_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+
+
+def covered_authors(cur, author_keys, policy=None):
+    """
+    Subset of `author_keys` whose images satisfy the coverage policy. Only images that made it
+    through the vision batch (a non-NA row in alttxt_processed_data) count, so an author whose
+    batch failed is fetched again. Authors missing from the index are first seeded from image_fetched_data.
+    """
+    policy = policy or coverage_policy()
+    author_keys = list(author_keys)
+    cur.execute("""
+        INSERT INTO author_image_index (author, image_count, last_fetched_at, updated_at)
+        SELECT author, COUNT(*), MAX(timestamp), NOW()
+        FROM image_fetched_data
+        WHERE author = ANY(%s)
+        GROUP BY author
+        ON CONFLICT (author) DO NOTHING;
+    """, (author_keys,))
+    cur.execute("SELECT to_regclass('alttxt_processed_data') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return set()
+
+    cur.execute("""
+        SELECT x.author
+        FROM author_image_index x
+        JOIN (
+            SELECT author, COUNT(*) AS alt_texted
+            FROM alttxt_processed_data
+            WHERE author = ANY(%s) AND alttxt IS NOT NULL AND alttxt <> 'NA'
+            GROUP BY author
+        ) a ON a.author = x.author
+        WHERE a.alt_texted >= %s
+          AND (%s = 0 OR x.last_fetched_at > NOW() - make_interval(days => %s));
+    """, (author_keys, policy["min_count"], policy["max_age_days"], policy["max_age_days"]))
+    return {row[0] for row in cur.fetchall()}
+
+
+def update_author_image_index(cur, fetched_counts):
+    """
+    fetched_counts: {author_key: images stored this run}. A refresh adds to the count and resets the age.
+    """
+    if fetched_counts:
+        execute_values(cur, """
+            INSERT INTO author_image_index (author, image_count, last_fetched_at, updated_at)
+            VALUES %s
+            ON CONFLICT (author) DO UPDATE
+            SET image_count = author_image_index.image_count + EXCLUDED.image_count,
+                last_fetched_at = EXCLUDED.last_fetched_at,
+                updated_at = NOW();
+        """, list(fetched_counts.items()), template="(%s, %s, NOW(), NOW())")
@@ -1,191 +1,257 @@
-import os
 import json
 import uuid
-import pandas as pd
-import psycopg2
-import httpx
+from concurrent.futures import as_completed
+from services.db import get_db_connection
+from services.batch_shards import iter_jsonl_shards, upload_and_submit_shard, shard_limits
+from services.azure_client import get_azure_client
+from services.batch_results import ensure_processed_tables, upsert_text_rows
+from services.llm_cache import (
+    ensure_cache_tables, request_hash, lookup_responses, index_requests,
+    find_uploaded_file, remember_uploaded_file
+)
+from psycopg2.extras import execute_values
 from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def build_text_batch_record(row, deployment_model):
+    quotes = [row.get(f"s{i}paragraph1", '') for i in range(2, 10)]
+    block = "\n".join(f"- {q}" for q in quotes if q and q != "NA")
+    prompt = (
+        f"You're given a series of quotes by {row['author_name']}\n"
+        f"Use them to generate metadata for a web story.\n"
+        f"Quotes:\n{block}\n\n"
+        "Please respond ONLY in this exact JSON format:\n"
+        "{\n  \"storytitle\": \"...\",\n  \"metadescription\": \"...\",\n  \"metakeywords\": \"...\"\n}"
+    )
+    return {
+        "custom_id": row["batch_custom_id"],
+        "method": "POST",
+        "url": "/chat/completions",
+        "body": {
+            "model": deployment_model,
+            "messages": [
+                {"role": "system", "content": "You are a creative and SEO-savvy content writer."},
+                {"role": "user", "content": prompt}
+            ]
+        }
+    }
+
+def ensure_tracker_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS batch_process_tracker_data (
+            id SERIAL PRIMARY KEY,
+            batch_task_id TEXT,
+            batch_type TEXT,
+            batch_id TEXT,
+            file_id TEXT,
+            jsonl_file TEXT,
+            csv_file TEXT,
+            status TEXT,
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+
+    # ✅ Ensure tracker table has required columns
+    cur.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'batch_process_tracker_data'
+                AND column_name = 'batch_completion_status'
+            ) THEN
+                ALTER TABLE batch_process_tracker_data
+                ADD COLUMN batch_completion_status TEXT DEFAULT 'processing';
+            END IF;
+
+            IF NOT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'batch_process_tracker_data'
+                AND column_name = 'tracking_url'
+            ) THEN
+                ALTER TABLE batch_process_tracker_data
+                ADD COLUMN tracking_url TEXT;
+            END IF;
+        END$$;
+    """)
+
+    # ✅ Which custom_ids each batch carried, so unanswered rows can be released if it dies
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS batch_request_ids (
+            batch_id TEXT,
+            custom_id TEXT,
+            PRIMARY KEY (batch_id, custom_id)
+        );
+    """)
+
+def record_batch_requests(cur, batch_id, custom_ids):
+    if custom_ids:
+        execute_values(cur, """
+            INSERT INTO batch_request_ids (batch_id, custom_id)
+            VALUES %s
+            ON CONFLICT DO NOTHING;
+        """, [(batch_id, custom_id) for custom_id in custom_ids], page_size=1000)
+
+def serve_text_cache_hits(cur, hits):
+    """
+    Write cached answers straight into template1_text_batch_processed_data: [(row, content)].
+    """
+    processed, served_ids = [], []
+    for row, content in hits:
+        try:
+            content_json = json.loads(content)
+        except json.JSONDecodeError:
+            continue
+        processed.append((
+            row["batch_custom_id"],
+            content_json.get("storytitle", ""),
+            content_json.get("metadescription", ""),
+            content_json.get("metakeywords", ""),
+            datetime.utcnow()
+        ))
+        served_ids.append(row["id"])
+
+    if not processed:
+        return 0
+
+    ensure_processed_tables(cur)
+    upsert_text_rows(cur, processed)
+    cur.execute("""
+        UPDATE template1_text_structure_data
+        SET batch_created = TRUE
+        WHERE id = ANY(%s);
+    """, (served_ids,))
+    return len(processed)
+
 def generate_and_upload_batch():
     try:
         deployment_model = "gpt-4o-global-batch"
         ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+        limits = shard_limits()
+        client = get_azure_client()
 
         # ✅ Step 1: Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DATABASE"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            port=os.getenv("PG_PORT")
-        )
-        cur = conn.cursor()
-
-        # ✅ Step 1.0: Ensure tracker table exists
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS batch_process_tracker_data (
-                id SERIAL PRIMARY KEY,
-                batch_task_id TEXT,
-                batch_type TEXT,
-                batch_id TEXT,
-                file_id TEXT,
-                jsonl_file TEXT,
-                csv_file TEXT,
-                status TEXT,
-                timestamp TIMESTAMPTZ DEFAULT NOW()
-            );
-        """)
-
-        # ✅ Step 1.1: Ensure tracker table has required columns
-        cur.execute("""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'batch_process_tracker_data'
-                    AND column_name = 'batch_completion_status'
-                ) THEN
-                    ALTER TABLE batch_process_tracker_data
-                    ADD COLUMN batch_completion_status TEXT DEFAULT 'processing';
-                END IF;
-
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'batch_process_tracker_data'
-                    AND column_name = 'tracking_url'
-                ) THEN
-                    ALTER TABLE batch_process_tracker_data
-                    ADD COLUMN tracking_url TEXT;
-                END IF;
-            END$$;
-        """)
-
-        # ✅ Step 2: Fetch unprocessed rows
-        cur.execute("""
-            SELECT batch_task_id, text_structure_id, batch_custom_id,
-                   s2paragraph1, s3paragraph1, s4paragraph1, s5paragraph1,
-                   s6paragraph1, s7paragraph1, s8paragraph1, s9paragraph1,
-                   author_name, batch_type, batch_created
-            FROM template1_text_structure_data
-            WHERE batch_created IS NOT TRUE;
-        """)
-        rows = cur.fetchall()
-        columns = ["batch_task_id", "text_structure_id", "batch_custom_id",
-                   "s2paragraph1", "s3paragraph1", "s4paragraph1", "s5paragraph1",
-                   "s6paragraph1", "s7paragraph1", "s8paragraph1", "s9paragraph1",
-                   "author_name", "batch_type", "batch_created"]
-        final = pd.DataFrame(rows, columns=columns)
-
-        if final.empty:
-            return {"status": "no_data", "message": "No unprocessed quotes found."}
-
-        # ✅ Step 3: Generate JSONL payload
-        payloads = []
-        for _, row in final.iterrows():
-            quotes = [row.get(f"s{i}paragraph1", '') for i in range(2, 10)]
-            block = "\n".join(f"- {q}" for q in quotes if q and q != "NA")
-            prompt = (
-                f"You're given a series of quotes by {row['author_name']}\n"
-                f"Use them to generate metadata for a web story.\n"
-                f"Quotes:\n{block}\n\n"
-                "Please respond ONLY in this exact JSON format:\n"
-                "{\n  \"storytitle\": \"...\",\n  \"metadescription\": \"...\",\n  \"metakeywords\": \"...\"\n}"
-            )
-            payloads.append({
-                "custom_id": row["batch_custom_id"],
-                "method": "POST",
-                "url": "/chat/completions",
-                "body": {
-                    "model": deployment_model,
-                    "messages": [
-                        {"role": "system", "content": "You are a creative and SEO-savvy content writer."},
-                        {"role": "user", "content": prompt}
-                    ]
-                }
-            })
-
-        jsonl_filename = f"quotefancy_azure_batch_{ts}.jsonl"
-        with open(jsonl_filename, "w") as f:
-            for record in payloads:
-                f.write(json.dumps(record) + '\n')
-
-        # ✅ Step 4: Upload JSONL to Azure REST
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        api_version = "2025-03-01-preview"
-        upload_url = f"{endpoint}/openai/files?api-version={api_version}"
-        headers = {"api-key": api_key}
-
-        with open(jsonl_filename, "rb") as file:
-            files = {
-                "purpose": (None, "batch"),
-                "file": (jsonl_filename, file, "application/json"),
-                "expires_after.seconds": (None, "1209600"),
-                "expires_after.anchor": (None, "created_at")
-            }
-            response = httpx.post(upload_url, headers=headers, files=files)
-            if response.status_code not in [200, 201]:
-                raise Exception(f"File upload failed: {response.text}")
-            file_id = response.json()["id"]
-
-        # ✅ Step 5: Submit Batch Job
-        batch_url = f"{endpoint}/openai/batches?api-version={api_version}"
-        batch_headers = {
-            "api-key": api_key,
-            "Content-Type": "application/json"
-        }
-        batch_payload = {
-            "input_file_id": file_id,
-            "endpoint": "/chat/completions",
-            "completion_window": "24h",
-            "output_expires_after": {"seconds": 1209600},
-            "anchor": "created_at"
-        }
+        with get_db_connection() as conn:
+            cur = conn.cursor()
 
-        batch_response = httpx.post(batch_url, headers=batch_headers, json=batch_payload)
-        if batch_response.status_code not in [200, 201]:
-            raise Exception(f"Batch creation failed: {batch_response.text}")
-        batch_data = batch_response.json()
-        batch_id = batch_data["id"]
-
-        print(f"✅ Batch submitted: batch_id={batch_id}, file_id={file_id}")
-
-        # ✅ Step 6: Track batch submission in DB
-        tracking_url = f"{endpoint}/openai/batches/{batch_id}?api-version={api_version}"
-
-        for task_id in final["batch_task_id"].unique():
-            cur.execute("""
-                INSERT INTO batch_process_tracker_data (
-                    batch_task_id, batch_type, batch_id, file_id,
-                    jsonl_file, csv_file, status, batch_completion_status, tracking_url, timestamp
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                task_id, "Auto", batch_id, file_id,
-                jsonl_filename, f"structured_data_{ts}.csv", "Submitted", "processing", tracking_url, datetime.utcnow()
-            ))
-
-            cur.execute("""
-                UPDATE template1_text_structure_data
-                SET batch_created = TRUE
-                WHERE batch_task_id = %s;
-            """, (task_id,))
-
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        return {
-            "status": "success",
-            "batch_id": batch_id,
-            "file_id": file_id,
-            "jsonl_file": jsonl_filename,
-            "total_prompts": len(payloads),
-            "tracking_url": tracking_url
-        }
+            # ✅ Step 1.0: Ensure tracker table exists
+            ensure_tracker_table(cur)
+            ensure_cache_tables(cur)
+            conn.commit()
+
+            # ✅ Step 2: Stream unprocessed rows through a server-side cursor
+            columns = ["id", "batch_task_id", "text_structure_id", "batch_custom_id",
+                       "s2paragraph1", "s3paragraph1", "s4paragraph1", "s5paragraph1",
+                       "s6paragraph1", "s7paragraph1", "s8paragraph1", "s9paragraph1",
+                       "author_name", "batch_type", "batch_created"]
+            read_cur = conn.cursor(name=f"text_batch_{uuid.uuid4().hex[:8]}", withhold=True)
+            read_cur.itersize = 2000
+            read_cur.execute(f"""
+                SELECT {', '.join(columns)}
+                FROM template1_text_structure_data
+                WHERE batch_created IS NOT TRUE
+                ORDER BY id;
+            """)
+
+            cache_counts = {"hits": 0}
+
+            def records():
+                # ✅ Serve identical prompts from the response cache; only misses reach the JSONL
+                while True:
+                    chunk = read_cur.fetchmany(500)
+                    if not chunk:
+                        break
+                    built = []
+                    for values in chunk:
+                        row = dict(zip(columns, values))
+                        record = build_text_batch_record(row, deployment_model)
+                        built.append((row, record, request_hash(record["body"])))
+
+                    cached = lookup_responses(cur, "text", [h for _, _, h in built])
+                    cache_counts["hits"] += serve_text_cache_hits(
+                        cur, [(row, cached[h]) for row, _, h in built if h in cached]
+                    )
+                    misses = [(row, record, h) for row, record, h in built if h not in cached]
+                    index_requests(cur, "text", [(record["custom_id"], h) for _, record, h in misses])
+
+                    for row, record, _ in misses:
+                        yield record, row["id"], row["batch_task_id"]
+
+            # ✅ Step 3: Serialize into JSONL shards; the shared Azure client uploads/submits them concurrently
+            shards = {}
+            name_for_part = lambda part: f"quotefancy_azure_batch_{ts}_part{part:03d}.jsonl"
+            for shard in iter_jsonl_shards(records(), name_for_part, limits):
+                # Identical JSONL content reuses the already uploaded file
+                reused_file_id = find_uploaded_file(cur, shard.content_sha)
+                shards[client.submit(upload_and_submit_shard(client, shard, reused_file_id))] = shard
+
+            read_cur.close()
+            conn.commit()
+            if not shards:
+                if cache_counts["hits"]:
+                    return {
+                        "status": "success",
+                        "message": "All prompts served from the response cache.",
+                        "batches": [],
+                        "total_prompts": 0,
+                        "cache_hits": cache_counts["hits"]
+                    }
+                return {"status": "no_data", "message": "No unprocessed quotes found."}
+
+            # ✅ Step 4: Track each submitted shard in DB
+            submitted, failed = [], []
+            for future in as_completed(shards):
+                shard = shards[future]
+                try:
+                    file_id, batch_id, tracking_url = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Shard {shard.name} failed: {e}")
+                    failed.append({"jsonl_file": shard.name, "prompts": shard.request_count, "detail": str(e)})
+                    continue
+
+                print(f"✅ Batch submitted: batch_id={batch_id}, file_id={file_id}, shard={shard.name}")
+                remember_uploaded_file(cur, shard.content_sha, file_id, shard.name)
+                for task_id in sorted(shard.task_ids):
+                    cur.execute("""
+                        INSERT INTO batch_process_tracker_data (
+                            batch_task_id, batch_type, batch_id, file_id,
+                            jsonl_file, csv_file, status, batch_completion_status, tracking_url, timestamp
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (
+                        task_id, "Auto", batch_id, file_id,
+                        shard.name, f"structured_data_{ts}.csv", "Submitted", "processing", tracking_url, datetime.utcnow()
+                    ))
+
+                cur.execute("""
+                    UPDATE template1_text_structure_data
+                    SET batch_created = TRUE
+                    WHERE id = ANY(%s)
+                    RETURNING batch_custom_id;
+                """, (shard.row_ids,))
+                record_batch_requests(cur, batch_id, [row[0] for row in cur.fetchall() if row[0]])
+                conn.commit()
+
+                submitted.append({
+                    "batch_id": batch_id,
+                    "file_id": file_id,
+                    "jsonl_file": shard.name,
+                    "prompts": shard.request_count,
+                    "bytes": shard.byte_count,
+                    "tracking_url": tracking_url
+                })
+
+            cur.close()
+
+            return {
+                "status": "success" if not failed else ("partial" if submitted else "error"),
+                "batches": submitted,
+                "failed_shards": failed,
+                "total_prompts": sum(s["prompts"] for s in submitted),
+                "cache_hits": cache_counts["hits"]
+            }
 
     except Exception as e:
         print(f"[ERROR] Batch process failed: {e}")
-        return {"status": "error", "detail": str(e)}
\ No newline at end of file
+        return {"status": "error", "detail": str(e)}
@@ -0,0 +1,216 @@
+import os
+import random
+import asyncio
+import threading
+import importlib.util
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AZURE_API_VERSION = "2025-03-01-preview"
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def client_settings():
+    return {
+        "max_connections": int(os.getenv("AZURE_HTTP_MAX_CONNECTIONS", "20")),
+        "concurrency": int(os.getenv("AZURE_HTTP_CONCURRENCY", "8")),
+        "connect_timeout": float(os.getenv("AZURE_HTTP_CONNECT_TIMEOUT", "10")),
+        "read_timeout": float(os.getenv("AZURE_HTTP_READ_TIMEOUT", "120")),
+        "write_timeout": float(os.getenv("AZURE_HTTP_WRITE_TIMEOUT", "300")),
+        "max_retries": int(os.getenv("AZURE_HTTP_MAX_RETRIES", "5")),
+        "backoff_base": float(os.getenv("AZURE_HTTP_BACKOFF_BASE", "1")),
+        "backoff_max": float(os.getenv("AZURE_HTTP_BACKOFF_MAX", "60")),
+    }
+
+
+class AzureAPIError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+class AzureOpenAIClient:
+    """
+    Shared httpx.AsyncClient for Azure OpenAI files/batches, running on its own event loop
+    thread so the sync services can call it via run() or submit().
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or client_settings()
+        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+        self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="azure-client-loop", daemon=True)
+        self.thread.start()
+        self.run(self._open())
+
+    async def _open(self):
+        s = self.settings
+        self.semaphore = asyncio.Semaphore(s["concurrency"])
+        self.http = httpx.AsyncClient(
+            base_url=self.endpoint or "",
+            headers={"api-key": self.api_key or ""},
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=s["max_connections"], max_keepalive_connections=s["max_connections"]),
+            timeout=httpx.Timeout(
+                connect=s["connect_timeout"], read=s["read_timeout"],
+                write=s["write_timeout"], pool=s["read_timeout"]
+            )
+        )
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, coro):
+        """Schedule a coroutine and return a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        if self.loop.is_running():
+            self.run(self.http.aclose())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+
+    def _backoff(self, attempt, response=None):
+        delay = _retry_after_seconds(response) if response is not None else None
+        if delay is None:
+            delay = self.settings["backoff_base"] * (2 ** attempt) * (0.5 + random.random() / 2)
+        return min(delay, self.settings["backoff_max"])
+
+    async def request(self, method, path, build_kwargs=None, ok_statuses=(200, 201), **kwargs):
+        """
+        Send a request with bounded concurrency, retrying 429/5xx and transport errors
+        with exponential backoff that honors Retry-After. `build_kwargs` is called per
+        attempt for bodies that must be rebuilt (e.g. rewound file uploads).
+        """
+        params = {"api-version": AZURE_API_VERSION, **kwargs.pop("params", {})}
+        max_retries = self.settings["max_retries"]
+
+        for attempt in range(max_retries + 1):
+            request_kwargs = dict(kwargs, **(build_kwargs() if build_kwargs else {}))
+            try:
+                async with self.semaphore:
+                    response = await self.http.request(method, path, params=params, **request_kwargs)
+            except httpx.TransportError as e:
+                if attempt == max_retries:
+                    raise AzureAPIError(f"{method} {path} failed: {e}")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code in ok_statuses:
+                return response
+            if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+                await asyncio.sleep(self._backoff(attempt, response))
+                continue
+            raise AzureAPIError(
+                f"{method} {path} failed ({response.status_code}): {response.text}", response.status_code
+            )
+
+    async def upload_file(self, filename, fileobj):
+        def build_kwargs():
+            fileobj.seek(0)
+            return {"files": {
+                "purpose": (None, "batch"),
+                "file": (filename, fileobj, "application/json"),
+                "expires_after.seconds": (None, "1209600"),
+                "expires_after.anchor": (None, "created_at")
+            }}
+
+        response = await self.request("POST", "/openai/files", build_kwargs=build_kwargs)
+        return response.json()["id"]
+
+    async def create_batch(self, file_id):
+        response = await self.request("POST", "/openai/batches", json={
+            "input_file_id": file_id,
+            "endpoint": "/chat/completions",
+            "completion_window": "24h",
+            "output_expires_after": {"seconds": 1209600},
+            "anchor": "created_at"
+        })
+        return response.json()
+
+    async def get_batch(self, batch_id):
+        response = await self.request("GET", f"/openai/batches/{batch_id}", ok_statuses=(200,))
+        return response.json()
+
+    async def get_file_content(self, file_id):
+        response = await self.request("GET", f"/openai/files/{file_id}/content", ok_statuses=(200,))
+        return response.text
+
+    async def download_to(self, file_id, open_sink):
+        """
+        Stream a file's content into the writable returned by `open_sink()` without buffering
+        the body. The sink is reopened on every attempt, so a retried download starts clean.
+        """
+        path = f"/openai/files/{file_id}/content"
+        params = {"api-version": AZURE_API_VERSION}
+        max_retries = self.settings["max_retries"]
+
+        for attempt in range(max_retries + 1):
+            try:
+                async with self.semaphore:
+                    async with self.http.stream("GET", path, params=params) as response:
+                        if response.status_code == 200:
+                            with open_sink() as sink:
+                                async for chunk in response.aiter_bytes():
+                                    sink.write(chunk)
+                            return
+                        await response.aread()
+            except httpx.TransportError as e:
+                if attempt == max_retries:
+                    raise AzureAPIError(f"GET {path} failed: {e}")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+                await asyncio.sleep(self._backoff(attempt, response))
+                continue
+            raise AzureAPIError(f"GET {path} failed ({response.status_code}): {response.text}", response.status_code)
+
+    def tracking_url(self, batch_id):
+        return f"{self.endpoint}/openai/batches/{batch_id}?api-version={AZURE_API_VERSION}"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_azure_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AzureOpenAIClient()
+        return _client
+
+
+def close_azure_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,47 @@
+import os
+import gzip
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv("BATCH_ARCHIVE_DIR", ".batch_archive")
+
+
+def archive_path(file_id):
+    return os.path.join(ARCHIVE_DIR, f"{file_id}.jsonl.gz")
+
+
+def has_archive(file_id):
+    return bool(file_id) and os.path.exists(archive_path(file_id))
+
+
+async def archive_file(client, file_id):
+    """
+    Stream an Azure output/error file into a gzip archive (skipped when already archived).
+    The archive only appears once the download has finished, so partial files are never replayed.
+    """
+    path = archive_path(file_id)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    part_path = f"{path}.part"
+    await client.download_to(file_id, lambda: gzip.open(part_path, "wb"))
+    os.replace(part_path, path)
+    return path
+
+
+def iter_archive(file_id):
+    """
+    Yield one parsed JSON object per line of an archived file, reading it lazily.
+    """
+    with gzip.open(archive_path(file_id), "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[WARN] Skipping malformed line in archive {file_id}")
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from services.db import get_db_connection
+from services.azure_client import get_azure_client
+from services.fetch import (
+    ensure_fetch_tables, load_pending_batches, poll_batches, ingest_batch_statuses
+)
+from services.llm_cache import ensure_cache_tables
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def poller_settings():
+    return {
+        "enabled": os.getenv("BATCH_POLLER_ENABLED", "true").lower() in ("1", "true", "yes"),
+        "tick_seconds": float(os.getenv("BATCH_POLLER_TICK_SECONDS", "15")),
+        "min_interval": float(os.getenv("BATCH_POLLER_MIN_INTERVAL", "30")),
+        "max_interval": float(os.getenv("BATCH_POLLER_MAX_INTERVAL", "1800")),
+    }
+
+
+def next_poll_interval(status, age_seconds, error_streak, settings):
+    """
+    Seconds until a batch should be polled again. Batches about to finish are checked often;
+    young or long-running in_progress batches back off; lookup errors back off exponentially.
+    """
+    if error_streak:
+        interval = settings["min_interval"] * (2 ** error_streak)
+    elif status == "finalizing":
+        interval = settings["min_interval"]
+    elif status == "validating":
+        interval = settings["min_interval"] * 2
+    elif age_seconds < 30 * 60:
+        # Fresh batches rarely finish within minutes
+        interval = settings["min_interval"] * 4
+    elif age_seconds < 6 * 3600:
+        interval = settings["min_interval"] * 10
+    else:
+        interval = settings["min_interval"] * 20
+    return max(settings["min_interval"], min(interval, settings["max_interval"]))
+
+
+class BatchPoller:
+    """
+    Background thread that polls processing Azure batches on adaptive intervals
+    and ingests them as soon as they complete.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or poller_settings()
+        self.enabled = self.settings["enabled"]
+        self.tracked = {}
+        self.stats = {"ticks": 0, "polls": 0, "batches_ingested": 0, "batches_failed": 0}
+        self.last_tick_at = None
+        self.last_error = None
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="azure-batch-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+        self._thread = None
+
+    def _run(self):
+        if self.enabled:
+            try:
+                self.ensure_schema()
+            except Exception as e:
+                # Retried by the first tick that reaches the database
+                self.last_error = str(e)
+                print(f"[ERROR] Batch poller schema setup failed: {e}")
+
+        while not self._stop.is_set():
+            if self.enabled:
+                try:
+                    self.tick()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"[ERROR] Batch poller tick failed: {e}")
+            self._stop.wait(self.settings["tick_seconds"])
+
+    def ensure_schema(self):
+        # Once per poller, not per tick: the ALTERs take ACCESS EXCLUSIVE locks even when nothing changes
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            ensure_cache_tables(cur)
+            ensure_fetch_tables(cur)
+            conn.commit()
+            cur.close()
+        self._schema_ready = True
+
+    def tick(self):
+        now = time.time()
+        if not self._schema_ready:
+            self.ensure_schema()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            pending = load_pending_batches(cur)
+
+            # ✅ Forget batches that left 'processing' (ingested elsewhere or failed)
+            pending_ids = {batch_id for batch_id, _, _ in pending}
+            with self._lock:
+                for batch_id in list(self.tracked):
+                    if batch_id not in pending_ids:
+                        del self.tracked[batch_id]
+
+                for batch_id, _, submitted_at in pending:
+                    self.tracked.setdefault(batch_id, {
+                        "status": None,
+                        "submitted_at": submitted_at,
+                        "next_poll_at": now,
+                        "last_polled_at": None,
+                        "error_streak": 0
+                    })
+                due = [b for b, state in self.tracked.items() if state["next_poll_at"] <= now]
+
+            self.last_tick_at = datetime.utcnow()
+            self.stats["ticks"] += 1
+            if not due:
+                cur.close()
+                return
+
+            # ✅ Poll only the batches whose interval has elapsed
+            client = get_azure_client()
+            jsonl_files = {batch_id: jsonl_file for batch_id, jsonl_file, _ in pending if batch_id in due}
+            statuses = client.run(poll_batches(client, due))
+            self.stats["polls"] += len(due)
+            self._schedule(statuses, now)
+
+            finished = {
+                batch_id: meta for batch_id, meta in statuses.items()
+                if not isinstance(meta, Exception) and meta.get("status") not in ("validating", "in_progress", "finalizing")
+            }
+            if finished:
+                result = ingest_batch_statuses(conn, cur, client, jsonl_files, finished)
+                self.stats["batches_ingested"] += result["batches_processed"]
+                self.stats["batches_failed"] += result["batches_failed"]
+            cur.close()
+
+    def _schedule(self, statuses, now):
+        with self._lock:
+            for batch_id, meta in statuses.items():
+                state = self.tracked[batch_id]
+                state["last_polled_at"] = now
+                if isinstance(meta, Exception):
+                    state["error_streak"] += 1
+                else:
+                    state["error_streak"] = 0
+                    state["status"] = meta.get("status")
+
+                submitted_at = state["submitted_at"]
+                age_seconds = (
+                    now - submitted_at.replace(tzinfo=submitted_at.tzinfo or timezone.utc).timestamp()
+                    if submitted_at else 0
+                )
+                state["next_poll_at"] = now + next_poll_interval(
+                    state["status"], age_seconds, state["error_streak"], self.settings
+                )
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            batches = [
+                {
+                    "batch_id": batch_id,
+                    "azure_status": state["status"],
+                    "next_poll_in_seconds": max(0, round(state["next_poll_at"] - now)),
+                    "error_streak": state["error_streak"]
+                }
+                for batch_id, state in sorted(self.tracked.items(), key=lambda item: item[1]["next_poll_at"])
+            ]
+        return {
+            "enabled": self.enabled,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "last_tick_at": self.last_tick_at.isoformat() if self.last_tick_at else None,
+            "last_error": self.last_error,
+            **self.stats,
+            "tracked_batches": batches
+        }
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_batch_poller():
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = BatchPoller()
+        return _poller
+
+
+def start_batch_poller():
+    get_batch_poller().start()
+
+
+def stop_batch_poller():
+    global _poller
+    with _poller_lock:
+        if _poller is not None:
+            _poller.stop()
+        _poller = None
@@ -0,0 +1,91 @@
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def ensure_unique_index(cur, index_name, table, column, keep_order):
+    """
+    Create a unique index on `column`, first deleting duplicate rows so the build cannot fail.
+    Within each duplicate group the first row by `keep_order` survives.
+    """
+    cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s;", (index_name,))
+    if cur.fetchone():
+        return
+
+    cur.execute(f"""
+        DELETE FROM {table} t
+        USING (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY {column} ORDER BY {keep_order}) AS rn
+            FROM {table}
+            WHERE {column} IS NOT NULL
+        ) d
+        WHERE t.id = d.id AND d.rn > 1;
+    """)
+    cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table} ({column});")
+
+
+def ensure_processed_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS template1_text_batch_processed_data (
+            id SERIAL PRIMARY KEY,
+            batch_custom_id TEXT,
+            storytitle TEXT,
+            metadescription TEXT,
+            metakeywords TEXT,
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS image_batch_processed_data (
+            id SERIAL PRIMARY KEY,
+            custom_id TEXT,
+            alttxt TEXT,
+            merged_status TEXT DEFAULT 'Pending',
+            timestamp TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    # Newest answer wins for text; for ALT text keep a row that was already merged
+    ensure_unique_index(
+        cur, "uq_text_batch_processed_custom_id", "template1_text_batch_processed_data",
+        "batch_custom_id", "timestamp DESC, id DESC"
+    )
+    ensure_unique_index(
+        cur, "uq_image_batch_processed_custom_id", "image_batch_processed_data",
+        "custom_id", "(merged_status = 'Pending'), id"
+    )
+
+
+def upsert_text_rows(cur, rows):
+    """
+    rows: [(batch_custom_id, storytitle, metadescription, metakeywords, timestamp)]
+    """
+    # One row per key, otherwise ON CONFLICT DO UPDATE rejects the page
+    rows = list({row[0]: row for row in rows}.values())
+    if rows:
+        execute_values(cur, """
+            INSERT INTO template1_text_batch_processed_data (
+                batch_custom_id, storytitle, metadescription, metakeywords, timestamp
+            ) VALUES %s
+            ON CONFLICT (batch_custom_id) DO UPDATE
+            SET storytitle = EXCLUDED.storytitle,
+                metadescription = EXCLUDED.metadescription,
+                metakeywords = EXCLUDED.metakeywords,
+                timestamp = EXCLUDED.timestamp;
+        """, rows, page_size=1000)
+
+
+def upsert_image_rows(cur, rows):
+    """
+    rows: [(custom_id, alttxt, timestamp)]. merged_status of existing rows is left alone.
+    """
+    rows = list({row[0]: row for row in rows}.values())
+    if rows:
+        execute_values(cur, """
+            INSERT INTO image_batch_processed_data (
+                custom_id, alttxt, merged_status, timestamp
+            ) VALUES %s
+            ON CONFLICT (custom_id) DO UPDATE
+            SET alttxt = EXCLUDED.alttxt,
+                timestamp = EXCLUDED.timestamp;
+        """, [(cid, alt, "Pending", ts) for (cid, alt, ts) in rows], page_size=1000)
@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def shard_limits():
+    return {
+        "max_requests": int(os.getenv("AZURE_BATCH_MAX_REQUESTS", "100000")),
+        "max_bytes": int(os.getenv("AZURE_BATCH_MAX_BYTES", str(190 * 1024 * 1024))),
+        "spool_bytes": int(os.getenv("AZURE_BATCH_SPOOL_BYTES", str(8 * 1024 * 1024))),
+    }
+
+
+class JsonlShard:
+    """
+    One JSONL batch input file, spooled in memory and rolled to disk past `spool_bytes`.
+    """
+
+    def __init__(self, name, spool_bytes):
+        self.name = name
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode="w+b")
+        self.request_count = 0
+        self.byte_count = 0
+        self.row_ids = []
+        self.task_ids = set()
+        self.hasher = hashlib.sha256()
+
+    def fits(self, line, max_requests, max_bytes):
+        return self.request_count + 1 <= max_requests and self.byte_count + len(line) <= max_bytes
+
+    def add(self, line, row_id=None, task_id=None):
+        self.file.write(line)
+        self.hasher.update(line)
+        self.request_count += 1
+        self.byte_count += len(line)
+        if row_id is not None:
+            self.row_ids.append(row_id)
+        if task_id is not None:
+            self.task_ids.add(task_id)
+
+    @property
+    def content_sha(self):
+        return self.hasher.hexdigest()
+
+    def close(self):
+        self.file.close()
+
+
+def iter_jsonl_shards(items, name_for_part, limits=None):
+    """
+    Serialize (record, row_id, task_id) items straight into size-bounded shards,
+    yielding each shard as soon as it is full.
+    """
+    limits = limits or shard_limits()
+    part = 1
+    shard = JsonlShard(name_for_part(part), limits["spool_bytes"])
+
+    for record, row_id, task_id in items:
+        line = (json.dumps(record) + "\n").encode()
+        if shard.request_count and not shard.fits(line, limits["max_requests"], limits["max_bytes"]):
+            yield shard
+            part += 1
+            shard = JsonlShard(name_for_part(part), limits["spool_bytes"])
+        shard.add(line, row_id, task_id)
+
+    if shard.request_count:
+        yield shard
+    else:
+        shard.close()
+
+
+async def upload_and_submit_shard(client, shard, file_id=None):
+    """
+    Upload a shard through the shared Azure client (skipped when an identical file_id is given)
+    and create its batch job. Returns (file_id, batch_id, tracking_url).
+    """
+    try:
+        if file_id is None:
+            file_id = await client.upload_file(shard.name, shard.file)
+    finally:
+        shard.close()
+
+    batch = await client.create_batch(file_id)
+    return file_id, batch["id"], client.tracking_url(batch["id"])
@@ -0,0 +1,153 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.db import get_db_connection
+from services.rate_limiter import TokenBucket
+from services.quote_scraper import create_session
+from services.resizer import RESIZE_PRESETS, CDN_PREFIX_MEDIA
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def warm_settings():
+    return {
+        # Only gates the pipeline stage; the endpoint always warms when called
+        "enabled": os.getenv("CDN_WARM_ENABLED", "false").lower() in ("1", "true", "yes"),
+        "concurrency": int(os.getenv("CDN_WARM_CONCURRENCY", "8")),
+        "rate": float(os.getenv("CDN_WARM_RATE", "20")),
+        "burst": float(os.getenv("CDN_WARM_BURST", "20")),
+        "timeout": float(os.getenv("CDN_WARM_TIMEOUT", "30")),
+        # Point warm-up at a stand-in server (e.g. http://127.0.0.1:8080/) instead of the real CDN
+        "base_url": os.getenv("CDN_WARM_BASE_URL") or CDN_PREFIX_MEDIA,
+    }
+
+
+def warm_url(session, url, timeout):
+    """
+    GET the URL to completion so the CDN caches the full rendition.
+    Returns (ok, latency_ms, bytes).
+    """
+    start = time.perf_counter()
+    size = 0
+    try:
+        with session.get(url, timeout=timeout, stream=True) as response:
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+            ok = response.status_code < 400
+    except Exception:
+        ok = False
+    return ok, (time.perf_counter() - start) * 1000, size
+
+
+def _summarize(latencies, failures, size):
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else None
+
+    return {
+        "requests": len(ordered),
+        "failures": failures,
+        "bytes": size,
+        "avg_ms": round(sum(ordered) / len(ordered), 1) if ordered else None,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "max_ms": round(ordered[-1], 1) if ordered else None
+    }
+
+
+def warm_urls(items, settings=None):
+    """
+    Warm [(key, preset, url)] concurrently under a concurrency cap and a token-bucket rate limit.
+    Returns ({preset: stats}, set of keys with at least one failed URL).
+    """
+    settings = settings or warm_settings()
+    session = create_session(settings["concurrency"])
+    bucket = TokenBucket(settings["rate"], settings["burst"])
+    per_preset = {preset: {"latencies": [], "failures": 0, "bytes": 0} for preset in RESIZE_PRESETS}
+    failed_keys = set()
+
+    def warm(url):
+        bucket.acquire()
+        if settings["base_url"] != CDN_PREFIX_MEDIA and url.startswith(CDN_PREFIX_MEDIA):
+            url = settings["base_url"].rstrip("/") + "/" + url[len(CDN_PREFIX_MEDIA):]
+        return warm_url(session, url, settings["timeout"])
+
+    with ThreadPoolExecutor(max_workers=settings["concurrency"]) as executor:
+        futures = {executor.submit(warm, url): (key, preset) for key, preset, url in items}
+        for future in as_completed(futures):
+            key, preset = futures[future]
+            ok, latency_ms, size = future.result()
+            stats = per_preset[preset]
+            stats["latencies"].append(latency_ms)
+            stats["bytes"] += size
+            if not ok:
+                stats["failures"] += 1
+                failed_keys.add(key)
+
+    return {
+        preset: _summarize(stats["latencies"], stats["failures"], stats["bytes"])
+        for preset, stats in per_preset.items()
+    }, failed_keys
+
+
+def warm_resized_urls(limit=None):
+    """
+    Request every resize URL of rows not yet warmed. Rows whose URLs all succeeded are marked
+    cdn_warmed; rows with failures are retried on the next call.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'resized_url_data' AND column_name = 'cdn_warmed';
+        """)
+        if not cur.fetchone():
+            # Rows generated before warm-up existed count as warm; only new rows default to FALSE
+            cur.execute("""
+                ALTER TABLE resized_url_data ADD COLUMN IF NOT EXISTS cdn_warmed BOOLEAN DEFAULT TRUE;
+                ALTER TABLE resized_url_data ALTER COLUMN cdn_warmed SET DEFAULT FALSE;
+            """)
+        conn.commit()
+
+        presets = list(RESIZE_PRESETS)
+        cur.execute(f"""
+            SELECT id, {', '.join(presets)}
+            FROM resized_url_data
+            WHERE cdn_warmed IS NOT TRUE
+            ORDER BY id
+            LIMIT %s;
+        """, (limit,))
+        rows = cur.fetchall()
+        if not rows:
+            cur.close()
+            return {"status": "no_data", "message": "No unwarmed resize URLs found."}
+
+        items = [
+            (row[0], preset, url)
+            for row in rows
+            for preset, url in zip(presets, row[1:])
+            if url and url != "ERROR"
+        ]
+        started = time.perf_counter()
+        preset_stats, failed_ids = warm_urls(items)
+        elapsed = time.perf_counter() - started
+
+        warmed_ids = [row[0] for row in rows if row[0] not in failed_ids]
+        cur.execute("""
+            UPDATE resized_url_data
+            SET cdn_warmed = TRUE
+            WHERE id = ANY(%s);
+        """, (warmed_ids,))
+        conn.commit()
+        cur.close()
+
+        return {
+            "status": "success",
+            "rows_warmed": len(warmed_ids),
+            "rows_failed": len(failed_ids),
+            "urls_requested": len(items),
+            "elapsed_seconds": round(elapsed, 2),
+            "presets": preset_stats
+        }
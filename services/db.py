@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2 import extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "checkouts": 0,
+    "in_use": 0,
+    "peak_in_use": 0,
+    "discarded": 0,
+    "wait_timeouts": 0,
+    "total_wait_ms": 0.0,
+}
+
+
+def _pool_settings():
+    return {
+        "minconn": int(os.getenv("PG_POOL_MIN", "1")),
+        "maxconn": int(os.getenv("PG_POOL_MAX", "10")),
+        "timeout": float(os.getenv("PG_POOL_TIMEOUT", "30")),
+        "health_check": os.getenv("PG_POOL_HEALTH_CHECK", "true").lower() == "true",
+    }
+
+
+def init_pool(minconn=None, maxconn=None):
+    """
+    Create the shared connection pool. Called once from the app lifespan;
+    get_db_connection() also creates it lazily for scripts and workers.
+    """
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None:
+            return _pool
+
+        settings = _pool_settings()
+        minconn = settings["minconn"] if minconn is None else minconn
+        maxconn = settings["maxconn"] if maxconn is None else maxconn
+
+        _pool = pg_pool.ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            host=os.getenv("PG_HOST"),
+            database=os.getenv("PG_DATABASE"),
+            user=os.getenv("PG_USER"),
+            password=os.getenv("PG_PASSWORD"),
+            port=os.getenv("PG_PORT")
+        )
+        # ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait instead
+        _slots = threading.BoundedSemaphore(maxconn)
+        print(f"✅ PostgreSQL pool ready (min={minconn}, max={maxconn})")
+        return _pool
+
+
+def close_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+        _slots = None
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(pool, health_check):
+    conn = pool.getconn()
+    if health_check and not _is_healthy(conn):
+        # Drop the broken connection and open a fresh one in its place
+        pool.putconn(conn, close=True)
+        with _stats_lock:
+            _stats["discarded"] += 1
+        conn = pool.getconn()
+    return conn
+
+
+def _release(pool, conn):
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        with _stats_lock:
+            _stats["discarded"] += 1
+    pool.putconn(conn, close=broken)
+
+
+@contextmanager
+def get_db_connection():
+    """
+    Borrow a connection from the shared pool. Uncommitted work is rolled back
+    when the block exits, so callers commit explicitly as before.
+    """
+    pool = _pool or init_pool()
+    slots = _slots
+    settings = _pool_settings()
+
+    started = time.perf_counter()
+    if not slots.acquire(timeout=settings["timeout"]):
+        with _stats_lock:
+            _stats["wait_timeouts"] += 1
+        raise TimeoutError(f"No database connection available within {settings['timeout']}s")
+
+    try:
+        conn = _checkout(pool, settings["health_check"])
+    except Exception:
+        slots.release()
+        raise
+
+    with _stats_lock:
+        _stats["checkouts"] += 1
+        _stats["in_use"] += 1
+        _stats["peak_in_use"] = max(_stats["peak_in_use"], _stats["in_use"])
+        _stats["total_wait_ms"] += (time.perf_counter() - started) * 1000
+
+    try:
+        yield conn
+    finally:
+        try:
+            _release(pool, conn)
+        finally:
+            with _stats_lock:
+                _stats["in_use"] -= 1
+            slots.release()
+
+
+def pool_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+
+    pool = _pool
+    stats["initialized"] = pool is not None
+    if pool is not None:
+        stats["min_size"] = pool.minconn
+        stats["max_size"] = pool.maxconn
+        stats["open_connections"] = len(pool._pool) + len(pool._used)
+        stats["idle_connections"] = len(pool._pool)
+    stats["avg_wait_ms"] = round(stats["total_wait_ms"] / stats["checkouts"], 3) if stats["checkouts"] else 0.0
+    stats["total_wait_ms"] = round(stats["total_wait_ms"], 3)
+    return stats
@@ -1,79 +1,18 @@
-import os
-import psycopg2
+from services.db import get_db_connection
+from services.batch_results import ensure_unique_index
+import numpy as np
 import pandas as pd
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def distribute_urls():
-    conn = psycopg2.connect(
-        host=os.getenv("PG_HOST"),
-        database=os.getenv("PG_DATABASE"),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD"),
-        port=os.getenv("PG_PORT")
-    )
-    cur = conn.cursor()
-
-    # Load paragraph data
-    paragraph_query = """
-        SELECT batch_custom_id, s2paragraph1, s3paragraph1, s4paragraph1, s5paragraph1, s6paragraph1,
-               s7paragraph1, s8paragraph1, s9paragraph1, author_name, storytitle, metadescription, metakeywords
-        FROM textual_structured_data;
-    """
-    paragraph_df = pd.read_sql_query(paragraph_query, conn)
-
-    # Load image resize URLs including alttxt
-    resize_query = """
-        SELECT author, alttxt, potraightcoverurl, landscapecoverurl, squarecoverurl,
-               socialthumbnailcoverurl, nextstoryimageurl, standardurl
-        FROM resized_url_data;
-    """
-    resize_df = pd.read_sql_query(resize_query, conn)
-
-    # Normalize author names
-    paragraph_df["author_key"] = paragraph_df["author_name"].str.replace(" ", "_").str.strip()
-    resize_df["author"] = resize_df["author"].str.strip()
-
-    output_rows = []
-
-    for _, row in paragraph_df.iterrows():
-        author_key = row["author_key"]
-        author_images = resize_df[resize_df["author"] == author_key].reset_index(drop=True)
-        total_imgs = len(author_images)
-
-        if total_imgs == 0:
-            continue
-
-        combined = row.drop("author_key").to_dict()
-
-        for i in range(2, 10):  # s2 to s9
-            img_idx = (i - 2) % total_imgs
-            suffix = str(i)
-
-            combined[f"potraightcoverurl{suffix}"] = author_images.at[img_idx, 'potraightcoverurl']
-            combined[f"landscapecoverurl{suffix}"] = author_images.at[img_idx, 'landscapecoverurl']
-            combined[f"squarecoverurl{suffix}"] = author_images.at[img_idx, 'squarecoverurl']
-            combined[f"socialthumbnailcoverurl{suffix}"] = author_images.at[img_idx, 'socialthumbnailcoverurl']
-            combined[f"nextstoryimageurl{suffix}"] = author_images.at[img_idx, 'nextstoryimageurl']
-            combined[f"standardurl{suffix}"] = author_images.at[img_idx, 'standardurl']
-            combined[f"s{suffix}alt1"] = author_images.at[img_idx, 'alttxt']  # NEW LINE
-
-        # Add representative image + alt text (first image)
-        combined["potraightcoverurl"] = author_images.at[0, 'potraightcoverurl']
-        combined["landscapecoverurl"] = author_images.at[0, 'landscapecoverurl']
-        combined["squarecoverurl"] = author_images.at[0, 'squarecoverurl']
-        combined["socialthumbnailcoverurl"] = author_images.at[0, 'socialthumbnailcoverurl']
-        combined["nextstoryimageurl"] = author_images.at[0, 'nextstoryimageurl']
-        combined["s1image1"] = author_images.at[0, 'standardurl']
-        combined["s1alt1"] = author_images.at[0, 'alttxt']
-
-        combined["video_data_status"] = False
-        output_rows.append(combined)
-
-    final_df = pd.DataFrame(output_rows)
+RESIZE_COLUMNS = [
+    "potraightcoverurl", "landscapecoverurl", "squarecoverurl",
+    "socialthumbnailcoverurl", "nextstoryimageurl", "standardurl"
+]
 
-    # Create schema
+def ensure_distribution_table(cur):
     columns_to_create = """
         batch_custom_id TEXT,
         s2paragraph1 TEXT, s3paragraph1 TEXT, s4paragraph1 TEXT, s5paragraph1 TEXT,
@@ -82,8 +21,7 @@ def distribute_urls():
     """
     for i in range(2, 10):
         columns_to_create += f", s{i}alt1 TEXT"
-        for col in ["potraightcoverurl", "landscapecoverurl", "squarecoverurl",
-                    "socialthumbnailcoverurl", "nextstoryimageurl", "standardurl"]:
+        for col in RESIZE_COLUMNS:
             columns_to_create += f", {col}{i} TEXT"
 
     columns_to_create += """
@@ -103,22 +41,113 @@ def distribute_urls():
             {columns_to_create}
         );
     """)
+    # One row per story: re-runs only add stories that are not distributed yet
+    ensure_unique_index(
+        cur, "uq_distribution_data_batch_custom_id", "distribution_data",
+        "batch_custom_id", "video_data_status DESC, id"
+    )
 
-    if not final_df.empty:
-        insert_cols = list(final_df.columns)
-        insert_sql = f"""
-            INSERT INTO distribution_data ({', '.join(insert_cols)})
-            VALUES ({', '.join(['%s'] * len(insert_cols))});
-        """
-        cur.executemany(insert_sql, final_df[insert_cols].values.tolist())
-        conn.commit()
 
-    cur.close()
-    conn.close()
+def assign_author_images(paragraph_df, resize_df):
+    """
+    Give every story (paragraph_df, with an author_key column) its author's images from
+    resize_df. Returns (distribution rows, stories whose author has no images yet).
+    """
+    # ✅ One-time index: images grouped by author (stable, so each author keeps its row order),
+    # with each author's offset and image count into the sorted frame
+    resize_df = resize_df.assign(author=resize_df["author"].str.strip()).dropna(subset=["author"])
+    resize_df = resize_df.sort_values("author", kind="stable").reset_index(drop=True)
+    image_counts = resize_df.groupby("author", sort=False).size()
+    image_offsets = image_counts.cumsum() - image_counts
+
+    # Stories whose author has no images yet are skipped; the anti-join picks them up next run
+    has_images = paragraph_df["author_key"].isin(image_counts.index)
+    waiting_df = paragraph_df[~has_images]
+    paragraph_df = paragraph_df[has_images].reset_index(drop=True)
+    offsets = paragraph_df["author_key"].map(image_offsets).to_numpy(dtype=np.int64)
+    counts = paragraph_df["author_key"].map(image_counts).to_numpy(dtype=np.int64)
+
+    image_arrays = {col: resize_df[col].to_numpy(dtype=object) for col in RESIZE_COLUMNS + ["alttxt"]}
+    combined = {col: paragraph_df[col].to_numpy(dtype=object) for col in paragraph_df.columns if col != "author_key"}
+
+    # ✅ Slides s2–s9 cycle through the author's images: image (i - 2) % count
+    for i in range(2, 10):
+        image_idx = offsets + (i - 2) % counts
+        for col in RESIZE_COLUMNS:
+            combined[f"{col}{i}"] = image_arrays[col].take(image_idx)
+        combined[f"s{i}alt1"] = image_arrays["alttxt"].take(image_idx)
+
+    # Add representative image + alt text (first image)
+    for col in RESIZE_COLUMNS[:-1]:
+        combined[col] = image_arrays[col].take(offsets)
+    combined["s1image1"] = image_arrays["standardurl"].take(offsets)
+    combined["s1alt1"] = image_arrays["alttxt"].take(offsets)
+    combined["video_data_status"] = False
+
+    final_df = pd.DataFrame(combined, index=paragraph_df.index)
 
-    print(f"✅ Distribution completed for {len(final_df)} records")
+    return final_df, waiting_df
 
-    return {
-        "status": "success",
-        "records_distributed": len(final_df)
-    }
\ No newline at end of file
+
+def distribute_urls():
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+
+        ensure_distribution_table(cur)
+        conn.commit()
+
+        # ✅ Only stories not yet in distribution_data (anti-join on the unique key)
+        paragraph_query = """
+            SELECT t.batch_custom_id, t.s2paragraph1, t.s3paragraph1, t.s4paragraph1, t.s5paragraph1,
+                   t.s6paragraph1, t.s7paragraph1, t.s8paragraph1, t.s9paragraph1, t.author_name,
+                   t.storytitle, t.metadescription, t.metakeywords
+            FROM textual_structured_data t
+            WHERE t.batch_custom_id IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM distribution_data d WHERE d.batch_custom_id = t.batch_custom_id
+              );
+        """
+        paragraph_df = pd.read_sql_query(paragraph_query, conn)
+        if paragraph_df.empty:
+            cur.close()
+            return {"status": "success", "records_distributed": 0, "pending_image_stories": 0}
+
+        # ✅ Image resize URLs (with alttxt) for just the authors of those stories
+        paragraph_df["author_key"] = paragraph_df["author_name"].str.replace(" ", "_").str.strip()
+        resize_query = """
+            SELECT author, alttxt, potraightcoverurl, landscapecoverurl, squarecoverurl,
+                   socialthumbnailcoverurl, nextstoryimageurl, standardurl
+            FROM resized_url_data
+            WHERE btrim(author) = ANY(%(authors)s)
+            ORDER BY id;
+        """
+        resize_df = pd.read_sql_query(
+            resize_query, conn,
+            params={"authors": paragraph_df["author_key"].dropna().unique().tolist()}
+        )
+
+        final_df, waiting_df = assign_author_images(paragraph_df, resize_df)
+        pending_image_stories = len(waiting_df)
+        waiting_authors = sorted(waiting_df["author_name"].dropna().unique().tolist())
+
+        inserted = 0
+        if not final_df.empty:
+            insert_cols = list(final_df.columns)
+            inserted = len(execute_values(cur, f"""
+                INSERT INTO distribution_data ({', '.join(insert_cols)})
+                VALUES %s
+                ON CONFLICT (batch_custom_id) DO NOTHING
+                RETURNING id;
+            """, final_df[insert_cols].values.tolist(), page_size=1000, fetch=True))
+            conn.commit()
+
+        cur.close()
+
+        print(f"✅ Distribution completed for {inserted} records ({pending_image_stories} waiting for images)")
+
+        return {
+            "status": "success",
+            "records_distributed": inserted,
+            "pending_image_stories": pending_image_stories,
+            "authors_pending_images": waiting_authors[:100]
+        }
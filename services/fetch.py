@@ -1,135 +1,377 @@
 import os
-import httpx
 import json
-import psycopg2
+import asyncio
+from psycopg2.extras import execute_values
+from services.db import get_db_connection
+from services.azure_client import get_azure_client
+from services.azure_batch import ensure_tracker_table
+from services.batch_archive import archive_file, has_archive, iter_archive
+from services.batch_results import ensure_processed_tables, upsert_text_rows, upsert_image_rows
+from services.alttxtmatch import IMAGE_CUSTOM_ID_SQL
+from services.llm_cache import ensure_cache_tables, store_responses
 from dotenv import load_dotenv
 from datetime import datetime
 
 load_dotenv()
 
-def fetch_and_store_pending_batches():
-    try:
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        api_version = "2025-03-01-preview"
-        headers = {"api-key": api_key}
-
-        conn = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            database=os.getenv("PG_DATABASE"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            port=os.getenv("PG_PORT")
-        )
-        cur = conn.cursor()
+FAILED_BATCH_STATUSES = {"failed", "expired", "cancelled"}
+INGEST_CHUNK_ROWS = int(os.getenv("AZURE_FETCH_INGEST_CHUNK_ROWS", "1000"))
 
-        cur.execute("""
-            SELECT DISTINCT batch_id, jsonl_file FROM batch_process_tracker_data
-            WHERE batch_completion_status = 'processing'
-            LIMIT 15;
-        """)
-        pending_batches = cur.fetchall()
-        if not pending_batches:
-            return {"status": "no_pending_batches"}
-
-        text_rows = []
-        image_rows = []
-
-        for batch_id, jsonl_file in pending_batches:
-            if not jsonl_file:
-                continue
 
-            metadata_url = f"{endpoint}/openai/batches/{batch_id}?api-version={api_version}"
-            meta_resp = httpx.get(metadata_url, headers=headers)
-            if meta_resp.status_code != 200:
-                continue
+def ensure_fetch_tables(cur):
+    ensure_tracker_table(cur)
+    cur.execute("""
+        ALTER TABLE batch_process_tracker_data
+        ADD COLUMN IF NOT EXISTS output_file_id TEXT,
+        ADD COLUMN IF NOT EXISTS error_file_id TEXT;
+    """)
+    ensure_processed_tables(cur)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS batch_failed_requests (
+            id SERIAL PRIMARY KEY,
+            batch_id TEXT,
+            custom_id TEXT,
+            status_code INTEGER,
+            error_code TEXT,
+            error_message TEXT,
+            timestamp TIMESTAMPTZ DEFAULT NOW(),
+            UNIQUE (batch_id, custom_id)
+        );
+    """)
+
+
+async def poll_batches(client, batch_ids):
+    """
+    Fetch the metadata of every batch concurrently; the client's semaphore caps in-flight calls.
+    Returns {batch_id: metadata or exception}.
+    """
+    results = await asyncio.gather(*(client.get_batch(b) for b in batch_ids), return_exceptions=True)
+    return dict(zip(batch_ids, results))
+
+
+async def archive_outputs(client, file_ids, max_parallel):
+    """
+    Stream output/error files into the local archive, at most `max_parallel` at a time.
+    Returns {file_id: archive path or exception}.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def download(file_id):
+        async with semaphore:
+            return await archive_file(client, file_id)
+
+    results = await asyncio.gather(*(download(f) for f in file_ids), return_exceptions=True)
+    return dict(zip(file_ids, results))
+
+
+def _write_failures(cur, rows):
+    if rows:
+        execute_values(cur, """
+            INSERT INTO batch_failed_requests (
+                batch_id, custom_id, status_code, error_code, error_message, timestamp
+            ) VALUES %s
+            ON CONFLICT (batch_id, custom_id) DO NOTHING;
+        """, rows, page_size=1000)
 
-            output_file_id = meta_resp.json().get("output_file_id")
-            if not output_file_id:
-                continue
 
-            download_url = f"{endpoint}/openai/files/{output_file_id}/content?api-version={api_version}"
-            resp = httpx.get(download_url, headers=headers)
-            if resp.status_code != 200:
+def _failure_row(batch_id, data):
+    response = data.get("response") or {}
+    error = data.get("error") or (response.get("body") or {}).get("error") or {}
+    return (
+        batch_id,
+        data.get("custom_id"),
+        response.get("status_code"),
+        error.get("code"),
+        error.get("message"),
+        datetime.utcnow()
+    )
+
+
+def ingest_archived_batch(cur, batch_id, jsonl_file, output_file_id, error_file_id=None, latency_seconds=0):
+    """
+    Replay one batch's archived output (and error) file into the processed-data tables,
+    flushing every INGEST_CHUNK_ROWS rows so large outputs never sit in memory.
+    Returns {"text": n, "image": n, "failed": n}.
+    """
+    is_text = jsonl_file.startswith("quotefancy_azure_batch")
+    is_image = jsonl_file.startswith("image_alt_batch")
+    counts = {"text": 0, "image": 0, "failed": 0}
+    rows, cache_entries, failures = [], [], []
+
+    def flush():
+        if is_text:
+            upsert_text_rows(cur, rows)
+            counts["text"] += len(rows)
+        elif is_image:
+            upsert_image_rows(cur, rows)
+            counts["image"] += len(rows)
+        # ✅ Remember answers so identical future prompts skip Azure
+        store_responses(cur, "text" if is_text else "image", cache_entries, max(latency_seconds, 0))
+        _write_failures(cur, failures)
+        counts["failed"] += len(failures)
+        rows.clear()
+        cache_entries.clear()
+        failures.clear()
+
+    # A completed batch whose every request failed has only an error file
+    for data in (iter_archive(output_file_id) if output_file_id else ()):
+        custom_id = data.get("custom_id")
+        response = data.get("response") or {}
+        if response.get("status_code", 200) != 200:
+            failures.append(_failure_row(batch_id, data))
+            continue
+
+        body = response.get("body") or {}
+        message = (body.get("choices") or [{}])[0].get("message", {})
+        content = message.get("content")
+        if not custom_id or not content:
+            continue
+        usage = body.get("usage") or {}
+
+        if is_text:
+            try:
+                content_json = json.loads(content)
+            except json.JSONDecodeError:
                 continue
+            rows.append((
+                custom_id,
+                content_json.get("storytitle", ""),
+                content_json.get("metadescription", ""),
+                content_json.get("metakeywords", ""),
+                datetime.utcnow()
+            ))
+            cache_entries.append((custom_id, content, usage.get("total_tokens")))
 
-            for line in resp.text.strip().splitlines():
-                data = json.loads(line)
-                custom_id = data.get("custom_id")
-                message = data.get("response", {}).get("body", {}).get("choices", [{}])[0].get("message", {})
-                content = message.get("content")
+        elif is_image:
+            rows.append((custom_id, content, datetime.utcnow()))
+            cache_entries.append((custom_id, content, usage.get("total_tokens")))
 
-                if not custom_id or not content:
-                    continue
+        if len(rows) + len(failures) >= INGEST_CHUNK_ROWS:
+            flush()
+
+    # ✅ Requests Azure rejected outright live in the error file
+    if error_file_id and has_archive(error_file_id):
+        for data in iter_archive(error_file_id):
+            failures.append(_failure_row(batch_id, data))
+            if len(failures) >= INGEST_CHUNK_ROWS:
+                flush()
+
+    flush()
+    return counts
+
+
+def release_unanswered_requests(cur, batch_id, jsonl_file):
+    """
+    After a batch failed, expired or was cancelled, reset batch_created on the source rows it
+    carried that got no answer, so the next submit picks them up again. Returns the row count.
+    """
+    if jsonl_file.startswith("quotefancy_azure_batch"):
+        cur.execute("""
+            UPDATE template1_text_structure_data t
+            SET batch_created = FALSE
+            FROM batch_request_ids r
+            WHERE r.batch_id = %s
+              AND t.batch_custom_id = r.custom_id
+              AND t.batch_created IS TRUE
+              AND NOT EXISTS (
+                  SELECT 1 FROM template1_text_batch_processed_data p
+                  WHERE p.batch_custom_id = r.custom_id
+              );
+        """, (batch_id,))
+    elif jsonl_file.startswith("image_alt_batch"):
+        cur.execute(f"""
+            UPDATE image_fetched_data i
+            SET batch_created = FALSE
+            FROM batch_request_ids r
+            WHERE r.batch_id = %s
+              AND {IMAGE_CUSTOM_ID_SQL} = r.custom_id
+              AND i.batch_created IS TRUE
+              AND NOT EXISTS (
+                  SELECT 1 FROM image_batch_processed_data p
+                  WHERE p.custom_id = r.custom_id
+              );
+        """, (batch_id,))
+    else:
+        return 0
+    return cur.rowcount
+
+
+def load_pending_batches(cur):
+    """
+    One row per processing batch, however many batch_task_id rows point at it:
+    [(batch_id, jsonl_file, submitted_at)].
+    """
+    cur.execute("""
+        SELECT batch_id, MIN(jsonl_file), MIN(timestamp) FROM batch_process_tracker_data
+        WHERE batch_completion_status = 'processing'
+          AND batch_id IS NOT NULL AND jsonl_file IS NOT NULL AND jsonl_file <> ''
+        GROUP BY batch_id;
+    """)
+    return cur.fetchall()
 
-                if jsonl_file.startswith("quotefancy_azure_batch"):
-                    try:
-                        content_json = json.loads(content)
-                        text_rows.append((
-                            custom_id,
-                            content_json.get("storytitle", ""),
-                            content_json.get("metadescription", ""),
-                            content_json.get("metakeywords", ""),
-                            datetime.utcnow()
-                        ))
-                    except json.JSONDecodeError:
-                        continue
-
-                elif jsonl_file.startswith("image_alt_batch"):
-                    image_rows.append((custom_id, content, datetime.utcnow()))
-
-            # ✅ Mark the batch as completed
+
+def ingest_batch_statuses(conn, cur, client, jsonl_files, statuses):
+    """
+    Act on freshly polled batch metadata ({batch_id: metadata or exception}): archive the
+    output of finished batches and ingest it one batch per transaction. Failed, expired and
+    cancelled batches keep the answers they did return; their unanswered rows are released.
+    """
+    completed, failed_ids = {}, []
+    for batch_id, batch_meta in statuses.items():
+        if isinstance(batch_meta, Exception):
+            print(f"[ERROR] Batch {batch_id} lookup failed: {batch_meta}")
+        elif batch_meta.get("status") in FAILED_BATCH_STATUSES:
+            failed_ids.append(batch_id)
+            completed[batch_id] = batch_meta
+        elif batch_meta.get("status") == "completed":
+            completed[batch_id] = batch_meta
+
+    # ✅ Stream completed outputs and error files into the local archive in parallel
+    max_parallel = int(os.getenv("AZURE_FETCH_MAX_PARALLEL_DOWNLOADS", "4"))
+    file_ids = [
+        file_id
+        for meta in completed.values()
+        for file_id in (meta.get("output_file_id"), meta.get("error_file_id"))
+        if file_id
+    ]
+    archived = client.run(archive_outputs(client, file_ids, max_parallel))
+
+    totals = {"text": 0, "image": 0, "failed": 0}
+    batches_ingested = 0
+    requests_released = 0
+    ingest_errors = []
+
+    for batch_id, batch_meta in completed.items():
+        output_file_id = batch_meta.get("output_file_id")
+        error_file_id = batch_meta.get("error_file_id")
+        if output_file_id and isinstance(archived[output_file_id], Exception):
+            print(f"[ERROR] Output download for batch {batch_id} failed: {archived[output_file_id]}")
+            continue
+        if error_file_id and isinstance(archived[error_file_id], Exception):
+            if not output_file_id:
+                # The error file is all this batch produced; retry it on the next run
+                print(f"[ERROR] Error file download for batch {batch_id} failed: {archived[error_file_id]}")
+                continue
+            print(f"[WARN] Error file download for batch {batch_id} failed: {archived[error_file_id]}")
+
+        # Turnaround of this batch, credited to every later cache hit
+        latency_seconds = (batch_meta.get("completed_at") or 0) - (batch_meta.get("created_at") or 0)
+        try:
+            counts = ingest_archived_batch(
+                cur, batch_id, jsonl_files[batch_id], output_file_id, error_file_id, latency_seconds
+            )
+
+            # ✅ The final status only flips in the same transaction as the batch's rows
+            failed = batch_id in failed_ids
             cur.execute("""
                 UPDATE batch_process_tracker_data
-                SET batch_completion_status = 'completed'
+                SET batch_completion_status = %s,
+                    output_file_id = %s,
+                    error_file_id = %s
                 WHERE batch_id = %s;
-            """, (batch_id,))
+            """, ("failed" if failed else "completed", output_file_id, error_file_id, batch_id))
+            released = release_unanswered_requests(cur, batch_id, jsonl_files[batch_id]) if failed else 0
+            conn.commit()
+        except Exception as e:
+            # Batch stays 'processing' and is retried on the next run
+            conn.rollback()
+            print(f"[ERROR] Ingest of batch {batch_id} failed: {e}")
+            ingest_errors.append({"batch_id": batch_id, "detail": str(e)})
+            continue
+
+        for key in totals:
+            totals[key] += counts[key]
+        batches_ingested += 1
+        requests_released += released
+
+    return {
+        "batches_checked": len(statuses),
+        "batches_processed": batches_ingested,
+        "batches_failed": len(failed_ids),
+        "batches_in_progress": len(statuses) - len(completed),
+        "text_entries_saved": totals["text"],
+        "image_entries_saved": totals["image"],
+        "failed_requests_saved": totals["failed"],
+        "requests_released": requests_released,
+        "ingest_errors": ingest_errors
+    }
+
+
+def fetch_and_store_pending_batches():
+    try:
+        client = get_azure_client()
+
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            ensure_cache_tables(cur)
+            ensure_fetch_tables(cur)
+            conn.commit()
+
+            pending_batches = load_pending_batches(cur)
+            if not pending_batches:
+                return {"status": "no_pending_batches"}
+
+            # ✅ Check every pending batch concurrently
+            jsonl_files = {batch_id: jsonl_file for batch_id, jsonl_file, _ in pending_batches}
+            statuses = client.run(poll_batches(client, list(jsonl_files)))
+
+            result = ingest_batch_statuses(conn, cur, client, jsonl_files, statuses)
+            cur.close()
+            return {"status": "success", **result}
+
+    except Exception as e:
+        return {"status": "error", "detail": str(e)}
+
+
+def replay_archived_batches(batch_id=None):
+    """
+    Re-ingest completed batches from the local archive without calling Azure,
+    e.g. after fixing a parsing bug. Rows are upserted, so replays never duplicate.
+    """
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            ensure_cache_tables(cur)
+            ensure_fetch_tables(cur)
+            conn.commit()
 
-        # ✅ Store textual data
-        if text_rows:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS template1_text_batch_processed_data (
-                    id SERIAL PRIMARY KEY,
-                    batch_custom_id TEXT,
-                    storytitle TEXT,
-                    metadescription TEXT,
-                    metakeywords TEXT,
-                    timestamp TIMESTAMPTZ DEFAULT NOW()
-                );
-            """)
-            cur.executemany("""
-                INSERT INTO template1_text_batch_processed_data (
-                    batch_custom_id, storytitle, metadescription, metakeywords, timestamp
-                ) VALUES (%s, %s, %s, %s, %s);
-            """, text_rows)
-
-        # ✅ Store image ALT text data
-        if image_rows:
             cur.execute("""
-                CREATE TABLE IF NOT EXISTS image_batch_processed_data (
-                    id SERIAL PRIMARY KEY,
-                    custom_id TEXT,
-                    alttxt TEXT,
-                    merged_status TEXT DEFAULT 'Pending',
-                    timestamp TIMESTAMPTZ DEFAULT NOW()
-                );
-            """)
-            cur.executemany("""
-                INSERT INTO image_batch_processed_data (
-                    custom_id, alttxt, merged_status, timestamp
-                ) VALUES (%s, %s, %s, %s);
-            """, [(cid, alt, "Pending", ts) for (cid, alt, ts) in image_rows])
-
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        return {
-            "status": "success",
-            "batches_processed": len(pending_batches),
-            "text_entries_saved": len(text_rows),
-            "image_entries_saved": len(image_rows)
-        }
+                SELECT batch_id, MIN(jsonl_file), MIN(output_file_id), MIN(error_file_id)
+                FROM batch_process_tracker_data
+                WHERE batch_completion_status IN ('completed', 'failed')
+                  AND (output_file_id IS NOT NULL OR error_file_id IS NOT NULL)
+                  AND (%s::TEXT IS NULL OR batch_id = %s)
+                GROUP BY batch_id;
+            """, (batch_id, batch_id))
+            batches = cur.fetchall()
+
+            totals = {"text": 0, "image": 0, "failed": 0}
+            replayed, missing = [], []
+            for bid, jsonl_file, output_file_id, error_file_id in batches:
+                if not has_archive(output_file_id or error_file_id):
+                    missing.append(bid)
+                    continue
+                try:
+                    counts = ingest_archived_batch(cur, bid, jsonl_file or "", output_file_id, error_file_id)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"[ERROR] Replay of batch {bid} failed: {e}")
+                    continue
+                for key in totals:
+                    totals[key] += counts[key]
+                replayed.append(bid)
+
+            cur.close()
+
+            return {
+                "status": "success",
+                "batches_replayed": len(replayed),
+                "batches_not_archived": missing,
+                "text_entries_saved": totals["text"],
+                "image_entries_saved": totals["image"],
+                "failed_requests_saved": totals["failed"]
+            }
 
     except Exception as e:
-        return {"status": "error", "detail": str(e)}
\ No newline at end of file
+        return {"status": "error", "detail": str(e)}
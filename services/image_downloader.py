@@ -1,10 +1,22 @@
 import os
+import io
 import shutil
 import boto3
 import base64
+import hashlib
 import json
+import time
 import uuid
-import psycopg2
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
+from services.db import get_db_connection
+from services.jobs import report_progress
+from services.quote_scraper import create_session
+from services.image_hash import ensure_phash_table, load_author_hashes, record_hashes, dhash, is_near_duplicate
+from services.s3_manifest import ensure_manifest_table, load_manifest, record_uploads
+from services.author_image_index import ensure_author_image_index, covered_authors, update_author_image_index
+from psycopg2.extras import execute_values
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
@@ -12,6 +24,59 @@ from simple_image_download import simple_image_download as simp
 
 load_dotenv()
 
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def image_settings():
+    return {
+        "per_author": int(os.getenv("AUTHOR_IMAGE_LIMIT", "15")),
+        "author_workers": int(os.getenv("IMAGE_AUTHOR_WORKERS", "8")),
+        "download_workers": int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "16")),
+        "upload_concurrency": int(os.getenv("S3_UPLOAD_CONCURRENCY", "16")),
+        "connect_timeout": float(os.getenv("IMAGE_CONNECT_TIMEOUT", "5")),
+        "read_timeout": float(os.getenv("IMAGE_READ_TIMEOUT", "20")),
+        "max_bytes": int(os.getenv("IMAGE_MAX_BYTES", str(15 * 1024 * 1024))),
+    }
+
+
+def find_image_urls(author, limit):
+    # One downloader per call: simple_image_download keeps per-instance state
+    return simp.simple_image_download().urls(author, limit)[:limit]
+
+
+def image_extension(url):
+    ext = os.path.splitext(url.split("?", 1)[0])[1].lower()
+    return ext if ext in IMAGE_EXTENSIONS else ".jpg"
+
+
+def download_image(session, url, settings):
+    """
+    Stream one image into memory with connect/read timeouts; non-images and oversized bodies are rejected.
+    """
+    timeout = (settings["connect_timeout"], settings["read_timeout"])
+    with session.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        if not response.headers.get("Content-Type", "image/").startswith("image/"):
+            raise ValueError(f"Not an image: {url}")
+
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(64 * 1024):
+            if buffer.tell() + len(chunk) > settings["max_bytes"]:
+                raise ValueError(f"Image larger than {settings['max_bytes']} bytes: {url}")
+            buffer.write(chunk)
+    return buffer.getvalue()
+
+
+def download_and_hash_image(session, url, settings):
+    """
+    Download one image and hash it in the worker thread: SHA-256 for the content-addressed
+    S3 key and a perceptual hash for near-duplicate detection. Returns (body, sha, phash).
+    Bodies Pillow cannot decode raise.
+    """
+    body = download_image(session, url, settings)
+    return body, hashlib.sha256(body).hexdigest(), dhash(io.BytesIO(body))
+
+
 def download_and_upload_author_images():
     # AWS + S3 setup
     aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -22,123 +87,195 @@ def download_and_upload_author_images():
     cdn_base_url = "https://cdn.suvichaar.org/"
 
     # DB connection
-    conn = psycopg2.connect(
-        host=os.getenv("PG_HOST"),
-        database=os.getenv("PG_DATABASE"),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD"),
-        port=os.getenv("PG_PORT")
-    )
-    cur = conn.cursor()
-
-    # ✅ Fetch next scrape_id group with unchecked authors
-    cur.execute("""
-        SELECT scrape_id FROM quote_scraped_data
-        WHERE author_image_check IS DISTINCT FROM 'checked'
-        GROUP BY scrape_id
-        ORDER BY MIN(timestamp)
-        LIMIT 1;
-    """)
-    result = cur.fetchone()
-    if not result:
-        return {"status": "no_pending_scrape_id"}
-
-    selected_scrape_id = result[0]
-
-    # ✅ Fetch all distinct authors for that scrape_id
-    cur.execute("""
-        SELECT DISTINCT author_name FROM quote_scraped_data
-        WHERE scrape_id = %s AND author_image_check IS DISTINCT FROM 'checked';
-    """, (selected_scrape_id,))
-    authors = [r[0].strip() for r in cur.fetchall() if r[0]]
-
-    if not authors:
-        return {"status": "no_authors"}
-
-    # ✅ Download images
-    downloader = simp.simple_image_download()
-    for author in authors:
-        downloader.download(author, 15)
-
-    # ✅ Upload to S3 and record metadata
-    s3 = boto3.client("s3",
-        aws_access_key_id=aws_access_key,
-        aws_secret_access_key=aws_secret_key,
-        region_name=region_name
-    )
-
-    results = []
-    batch_uuid = str(uuid.uuid4())[:8]
-    batch_task_id = f"{batch_uuid}_i1"  # Single task ID for this batch
-
-    for folder, _, files in os.walk("simple_images"):
-        for file in files:
-            if not file.lower().endswith((".jpg", ".jpeg", ".png")):
-                continue
-
-            path = os.path.join(folder, file)
-            author_name = os.path.basename(folder).replace(" ", "_")
-            filename = file.replace(" ", "_")
-            s3_key = f"{s3_prefix}{author_name}/{filename}"
-
-            try:
-                s3.upload_file(path, bucket_name, s3_key)
-                cdn_url = f"{cdn_base_url}{s3_key}"
-                batch_custom_id = f"{batch_task_id}_{author_name}"
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+
+        # ✅ Schema setup commits on its own so no DDL lock is held through the downloads
+        ensure_author_image_index(cur)
+        ensure_phash_table(cur)
+        ensure_manifest_table(cur)
+        conn.commit()
+
+        # ✅ Fetch next scrape_id group with unchecked authors
+        cur.execute("""
+            SELECT scrape_id FROM quote_scraped_data
+            WHERE author_image_check IS DISTINCT FROM 'checked'
+            GROUP BY scrape_id
+            ORDER BY MIN(timestamp)
+            LIMIT 1;
+        """)
+        result = cur.fetchone()
+        if not result:
+            return {"status": "no_pending_scrape_id"}
+
+        selected_scrape_id = result[0]
+
+        # ✅ Fetch all distinct authors for that scrape_id
+        cur.execute("""
+            SELECT DISTINCT author_name FROM quote_scraped_data
+            WHERE scrape_id = %s AND author_image_check IS DISTINCT FROM 'checked';
+        """, (selected_scrape_id,))
+        authors = [r[0].strip() for r in cur.fetchall() if r[0]]
 
+        if not authors:
+            return {"status": "no_authors"}
+
+        # ✅ Authors that already have enough fresh images are reused, not searched again
+        covered = covered_authors(cur, [a.replace(" ", "_") for a in authors])
+        reused_authors = [a for a in authors if a.replace(" ", "_") in covered]
+        fetch_authors = [a for a in authors if a.replace(" ", "_") not in covered]
+
+        # ✅ Download images concurrently; each finished download goes straight to the upload pool
+        settings = image_settings()
+        s3 = boto3.client("s3",
+            aws_access_key_id=aws_access_key,
+            aws_secret_access_key=aws_secret_key,
+            region_name=region_name,
+            config=Config(max_pool_connections=settings["upload_concurrency"])
+        )
+
+        results = []
+        batch_uuid = str(uuid.uuid4())[:8]
+        batch_task_id = f"{batch_uuid}_i1"  # Single task ID for this batch
+        counts = {
+            "urls_found": 0, "downloaded": 0, "download_failed": 0,
+            "duplicates_skipped": 0, "uploaded": 0, "already_in_bucket": 0, "upload_failed": 0
+        }
+        bytes_downloaded = 0
+        lookup_errors = {}
+
+        # ✅ Perceptual hashes of every image already uploaded for these authors
+        known_hashes = load_author_hashes(cur, [a.replace(" ", "_") for a in fetch_authors])
+        new_hashes = []
+
+        # ✅ Objects already in the bucket are never uploaded twice
+        manifest = load_manifest(cur, [f"{s3_prefix}{a.replace(' ', '_')}/" for a in fetch_authors])
+        uploaded = []
+        # End the read transaction before the network-bound phase
+        conn.commit()
+
+        session = create_session(settings["download_workers"])
+        transfer_config = TransferConfig(max_concurrency=settings["upload_concurrency"], use_threads=True)
+        started = time.perf_counter()
+
+        with create_transfer_manager(s3, transfer_config) as transfer, \
+                ThreadPoolExecutor(max_workers=settings["author_workers"]) as lookup_pool, \
+                ThreadPoolExecutor(max_workers=settings["download_workers"]) as download_pool:
+
+            url_futures = {
+                lookup_pool.submit(find_image_urls, author, settings["per_author"]): author
+                for author in fetch_authors
+            }
+            download_futures = {}
+            for future in as_completed(url_futures):
+                author = url_futures[future]
+                try:
+                    urls = future.result()
+                except Exception as e:
+                    lookup_errors[author] = str(e)
+                    continue
+
+                counts["urls_found"] += len(urls)
+                author_key = author.replace(" ", "_")
+                for rank, url in enumerate(urls, start=1):
+                    download = download_pool.submit(download_and_hash_image, session, url, settings)
+                    download_futures[download] = (author_key, image_extension(url), rank)
+
+            uploads = {}
+            for future in as_completed(download_futures):
+                author_key, ext, rank = download_futures.pop(future)
+                try:
+                    body, content_sha, image_hash = future.result()
+                except Exception:
+                    counts["download_failed"] += 1
+                    continue
+
+                counts["downloaded"] += 1
+                bytes_downloaded += len(body)
+
+                # ✅ Same portrait at another size/encoding: skip before S3, vision and resize ever see it
+                author_hashes = known_hashes.setdefault(author_key, [])
+                if is_near_duplicate(image_hash, author_hashes):
+                    counts["duplicates_skipped"] += 1
+                    continue
+                author_hashes.append(image_hash)
+
+                # Content-addressed name: a later run can never overwrite this object or reuse its custom_id
+                filename = f"{author_key}_{content_sha[:12]}{ext}"
+                s3_key = f"{s3_prefix}{author_key}/{filename}"
+                if manifest.get(s3_key) == content_sha:
+                    counts["already_in_bucket"] += 1
+                    upload = None
+                else:
+                    # ✅ Stream the in-memory body straight to S3, no disk staging
+                    upload = transfer.upload(io.BytesIO(body), bucket_name, s3_key)
+                manifest[s3_key] = content_sha
+                uploads[s3_key] = (upload, author_key, filename, image_hash, content_sha, len(body), rank)
+                report_progress(stage="download", **counts)
+
+            for s3_key, (upload, author_key, filename, image_hash, content_sha, size, rank) in uploads.items():
+                if upload is not None:
+                    try:
+                        upload.result()
+                    except Exception:
+                        counts["upload_failed"] += 1
+                        continue
+                    counts["uploaded"] += 1
+                    uploaded.append((s3_key, content_sha, size))
+
+                new_hashes.append((author_key, image_hash, filename, s3_key))
                 results.append((
-                    author_name,
+                    author_key,
                     filename,
-                    cdn_url,
+                    f"{cdn_base_url}{s3_key}",
                     batch_task_id,
-                    batch_custom_id,
+                    f"{batch_task_id}_{author_key}",
                     "Auto",
                     False,
+                    rank,
                     datetime.utcnow()
                 ))
+                report_progress(stage="upload", **counts)
+
+        elapsed = time.perf_counter() - started
 
-            except Exception as e:
-                continue
-
-    # ✅ Ensure image_fetched_data table exists
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS image_fetched_data (
-            id SERIAL PRIMARY KEY,
-            author TEXT,
-            filename TEXT,
-            cdn_url TEXT,
-            batch_task_id TEXT,
-            batch_custom_id TEXT,
-            batch_type TEXT,
-            batch_created BOOLEAN DEFAULT FALSE,
-            timestamp TIMESTAMPTZ DEFAULT NOW()
-        );
-    """)
-
-    # ✅ Insert rows
-    cur.executemany("""
-        INSERT INTO image_fetched_data (
-            author, filename, cdn_url, batch_task_id,
-            batch_custom_id, batch_type, batch_created, timestamp
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-    """, results)
-
-    # ✅ Update quote_scraped_data to mark authors as checked
-    for author in authors:
+        record_hashes(cur, new_hashes)
+        record_uploads(cur, uploaded)
+
+        # ✅ Insert rows
+        if results:
+            execute_values(cur, """
+                INSERT INTO image_fetched_data (
+                    author, filename, cdn_url, batch_task_id,
+                    batch_custom_id, batch_type, batch_created, search_rank, timestamp
+                ) VALUES %s;
+            """, results, page_size=1000)
+
+        fetched_counts = dict.fromkeys((a.replace(" ", "_") for a in fetch_authors), 0)
+        for row in results:
+            fetched_counts[row[0]] += 1
+        update_author_image_index(cur, fetched_counts)
+
+        # ✅ Mark every processed and reused author as checked in one statement
         cur.execute("""
             UPDATE quote_scraped_data
             SET author_image_check = 'checked'
-            WHERE author_name = %s AND scrape_id = %s;
-        """, (author, selected_scrape_id))
+            WHERE scrape_id = %s AND author_name = ANY(%s);
+        """, (selected_scrape_id, authors))
 
-    conn.commit()
-    cur.close()
-    conn.close()
+        conn.commit()
+        cur.close()
 
-    return {
-        "status": "success",
-        "scrape_id": selected_scrape_id,
-        "authors_processed": authors,
-        "image_count": len(results),
-        "db_table": "image_fetched_data"
-    }
+        return {
+            "status": "success",
+            "scrape_id": selected_scrape_id,
+            "authors_processed": fetch_authors,
+            "authors_reused": reused_authors,
+            "image_count": len(results),
+            **counts,
+            "lookup_errors": lookup_errors,
+            "elapsed_seconds": round(elapsed, 2),
+            "images_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+            "bytes_per_second": round(bytes_downloaded / elapsed) if elapsed else 0,
+            "db_table": "image_fetched_data"
+        }
@@ -0,0 +1,78 @@
+import os
+from PIL import Image
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PHASH_THRESHOLD = int(os.getenv("IMAGE_PHASH_THRESHOLD", "6"))
+_MASK = (1 << 64) - 1
+
+
+def dhash(source, size=8):
+    """
+    64-bit difference hash: grayscale, shrink to (size+1)×size, compare horizontal neighbours.
+    Robust to resizing and re-encoding, so the same portrait at different sizes hashes alike.
+    """
+    with Image.open(source) as image:
+        pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a, b):
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def is_near_duplicate(value, known, threshold=PHASH_THRESHOLD):
+    return any(hamming(value, other) <= threshold for other in known)
+
+
+def _to_signed(value):
+    # Postgres BIGINT is signed; store the unsigned 64-bit hash in two's complement
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def ensure_phash_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS image_phash_index (
+            id SERIAL PRIMARY KEY,
+            author TEXT,
+            phash BIGINT,
+            filename TEXT,
+            s3_key TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_image_phash_author ON image_phash_index (author);")
+
+
+def load_author_hashes(cur, authors):
+    """
+    {author: [hash, ...]} for images already uploaded in earlier runs.
+    """
+    cur.execute("""
+        SELECT author, phash FROM image_phash_index
+        WHERE author = ANY(%s);
+    """, (list(authors),))
+    known = {}
+    for author, value in cur.fetchall():
+        known.setdefault(author, []).append(value & _MASK)
+    return known
+
+
+def record_hashes(cur, rows):
+    """
+    rows: [(author, hash, filename, s3_key)]
+    """
+    if rows:
+        execute_values(cur, """
+            INSERT INTO image_phash_index (author, phash, filename, s3_key)
+            VALUES %s;
+        """, [(author, _to_signed(value), filename, s3_key) for author, value, filename, s3_key in rows])
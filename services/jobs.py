@@ -0,0 +1,171 @@
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def job_settings():
+    return {
+        "io_workers": int(os.getenv("JOBS_IO_WORKERS", "4")),
+        "cpu_workers": int(os.getenv("JOBS_CPU_WORKERS", str(os.cpu_count() or 2))),
+        "max_queued": int(os.getenv("JOBS_MAX_QUEUED", "20")),
+        "history": int(os.getenv("JOBS_HISTORY", "200")),
+    }
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobConflict(Exception):
+    """A job with the same name but different arguments is still queued/running."""
+
+    def __init__(self, job):
+        super().__init__(f"Job '{job['name']}' is already {job['status']} with other arguments")
+        self.job = job
+
+
+def job_params(args, kwargs):
+    return {"args": list(args), "kwargs": dict(sorted(kwargs.items()))}
+
+
+class JobManager:
+    """
+    Runs long stages off the request threadpool on two separately sized executors:
+    "io" for network/DB-bound stages and "cpu" for pandas/parsing-heavy ones.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or job_settings()
+        self.executors = {
+            "io": ThreadPoolExecutor(max_workers=self.settings["io_workers"], thread_name_prefix="job-io"),
+            "cpu": ThreadPoolExecutor(max_workers=self.settings["cpu_workers"], thread_name_prefix="job-cpu"),
+        }
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _active(self, kind=None, status=None):
+        return [
+            job for job in self.jobs.values()
+            if job["status"] in ((status,) if status else ("queued", "running"))
+            and (kind is None or job["kind"] == kind)
+        ]
+
+    def submit(self, name, fn, *args, kind="io", **kwargs):
+        """
+        Queue `fn` as a job. A job with the same name and arguments that is still queued/running
+        is returned instead of starting a duplicate; the same name with other arguments raises
+        JobConflict. JobQueueFull is raised once `max_queued` jobs are waiting.
+        """
+        params = job_params(args, kwargs)
+        with self._lock:
+            for job in self._active():
+                if job["name"] == name:
+                    if job["params"] == params:
+                        return job
+                    raise JobConflict(job)
+            if len(self._active(status="queued")) >= self.settings["max_queued"]:
+                raise JobQueueFull(f"{self.settings['max_queued']} jobs already queued; retry later")
+
+            job = {
+                "id": str(uuid.uuid4()),
+                "name": name,
+                "kind": kind,
+                "params": params,
+                "status": "queued",
+                "progress": None,
+                "submitted_at": datetime.utcnow(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+            self.jobs[job["id"]] = job
+            self._trim()
+
+        self.executors[kind].submit(self._execute, job, fn, args, kwargs)
+        return job
+
+    def _execute(self, job, fn, args, kwargs):
+        job["status"] = "running"
+        job["started_at"] = datetime.utcnow()
+        self._local.job = job
+        try:
+            result = fn(*args, **kwargs)
+            job["result"] = result
+            job["status"] = "failed" if isinstance(result, dict) and result.get("status") == "error" else "succeeded"
+        except Exception as e:
+            job["error"] = getattr(e, "detail", str(e))
+            job["status"] = "failed"
+        finally:
+            job["finished_at"] = datetime.utcnow()
+            self._local.job = None
+
+    def _trim(self):
+        # Drop the oldest finished jobs beyond the history limit
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("succeeded", "failed")]
+        for job_id in finished[:max(0, len(self.jobs) - self.settings["history"])]:
+            del self.jobs[job_id]
+
+    def report_progress(self, **progress):
+        """Called from inside a running job to publish progress; a no-op elsewhere."""
+        job = getattr(self._local, "job", None)
+        if job is not None:
+            job["progress"] = progress
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self, limit=50):
+        with self._lock:
+            return list(reversed(self.jobs.values()))[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                kind: {
+                    "workers": self.settings[f"{kind}_workers"],
+                    "running": len(self._active(kind, "running")),
+                    "queued": len(self._active(kind, "queued"))
+                }
+                for kind in self.executors
+            } | {"max_queued": self.settings["max_queued"]}
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def submit_job(name, fn, *args, kind="io", **kwargs):
+    return get_job_manager().submit(name, fn, *args, kind=kind, **kwargs)
+
+
+def report_progress(**progress):
+    if _manager is not None:
+        _manager.report_progress(**progress)
+
+
+def shutdown_jobs():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+        _manager = None
@@ -0,0 +1,159 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Azure input files expire after 14 days; only reuse ones safely inside that window
+FILE_REUSE_MAX_AGE_DAYS = int(os.getenv("AZURE_FILE_REUSE_MAX_AGE_DAYS", "13"))
+
+
+def ensure_cache_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            request_hash TEXT PRIMARY KEY,
+            kind TEXT,
+            content TEXT,
+            total_tokens INTEGER DEFAULT 0,
+            latency_seconds DOUBLE PRECISION DEFAULT 0,
+            hit_count INTEGER DEFAULT 0,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            last_hit_at TIMESTAMPTZ
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_request_index (
+            custom_id TEXT PRIMARY KEY,
+            request_hash TEXT,
+            kind TEXT,
+            submitted_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache_stats (
+            kind TEXT PRIMARY KEY,
+            lookups BIGINT DEFAULT 0,
+            hits BIGINT DEFAULT 0
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS azure_file_cache (
+            content_sha TEXT PRIMARY KEY,
+            file_id TEXT,
+            jsonl_file TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+
+
+def request_hash(body):
+    """
+    Hash of the normalized request (model + messages); other body fields do not change the answer key.
+    """
+    normalized = {"model": body.get("model"), "messages": body.get("messages")}
+    canonical = json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def lookup_responses(cur, kind, hashes):
+    """
+    Return {request_hash: content} for cached hashes and record the lookup/hit counts.
+    """
+    hashes = list(set(hashes))
+    if not hashes:
+        return {}
+
+    cur.execute("""
+        UPDATE llm_response_cache
+        SET hit_count = hit_count + 1, last_hit_at = NOW()
+        WHERE request_hash = ANY(%s) AND kind = %s
+        RETURNING request_hash, content;
+    """, (hashes, kind))
+    found = dict(cur.fetchall())
+
+    cur.execute("""
+        INSERT INTO llm_cache_stats (kind, lookups, hits)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (kind) DO UPDATE
+        SET lookups = llm_cache_stats.lookups + EXCLUDED.lookups,
+            hits = llm_cache_stats.hits + EXCLUDED.hits;
+    """, (kind, len(hashes), len(found)))
+    return found
+
+
+def index_requests(cur, kind, entries):
+    """
+    Remember which request hash each submitted custom_id carries: [(custom_id, request_hash)].
+    """
+    if not entries:
+        return
+    execute_values(cur, """
+        INSERT INTO llm_request_index (custom_id, request_hash, kind, submitted_at)
+        VALUES %s
+        ON CONFLICT (custom_id) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, kind = EXCLUDED.kind, submitted_at = EXCLUDED.submitted_at;
+    """, [(custom_id, h, kind, datetime.utcnow()) for custom_id, h in entries], page_size=1000)
+
+
+def store_responses(cur, kind, entries, latency_seconds):
+    """
+    Cache completed answers: [(custom_id, content, total_tokens)].
+    """
+    if not entries:
+        return
+    execute_values(cur, """
+        INSERT INTO llm_response_cache (request_hash, kind, content, total_tokens, latency_seconds)
+        SELECT DISTINCT ON (i.request_hash) i.request_hash, v.kind, v.content, v.total_tokens, v.latency_seconds
+        FROM (VALUES %s) AS v (custom_id, kind, content, total_tokens, latency_seconds)
+        JOIN llm_request_index i ON i.custom_id = v.custom_id
+        ON CONFLICT (request_hash) DO NOTHING;
+    """, [
+        (custom_id, kind, content, int(tokens or 0), float(latency_seconds))
+        for custom_id, content, tokens in entries
+    ], page_size=1000)
+
+
+def find_uploaded_file(cur, content_sha):
+    cur.execute("""
+        SELECT file_id FROM azure_file_cache
+        WHERE content_sha = %s
+          AND created_at > NOW() - make_interval(days => %s);
+    """, (content_sha, FILE_REUSE_MAX_AGE_DAYS))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def remember_uploaded_file(cur, content_sha, file_id, jsonl_file):
+    cur.execute("""
+        INSERT INTO azure_file_cache (content_sha, file_id, jsonl_file, created_at)
+        VALUES (%s, %s, %s, NOW())
+        ON CONFLICT (content_sha) DO UPDATE
+        SET file_id = EXCLUDED.file_id, jsonl_file = EXCLUDED.jsonl_file, created_at = NOW();
+    """, (content_sha, file_id, jsonl_file))
+
+
+def cache_stats(cur):
+    cur.execute("""
+        SELECT s.kind, s.lookups, s.hits,
+               COALESCE(SUM(c.hit_count * c.total_tokens), 0),
+               COALESCE(SUM(c.hit_count * c.latency_seconds), 0),
+               COUNT(c.request_hash)
+        FROM llm_cache_stats s
+        LEFT JOIN llm_response_cache c ON c.kind = s.kind
+        GROUP BY s.kind, s.lookups, s.hits
+        ORDER BY s.kind;
+    """)
+    stats = {}
+    for kind, lookups, hits, tokens_saved, latency_saved, entries in cur.fetchall():
+        stats[kind] = {
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "tokens_saved": int(tokens_saved),
+            "batch_latency_saved_seconds": round(float(latency_saved), 1),
+            "cached_responses": entries
+        }
+    return stats
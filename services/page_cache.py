@@ -0,0 +1,91 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_DIR = os.getenv("PAGE_CACHE_DIR", ".page_cache")
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _index_path(url):
+    return os.path.join(CACHE_DIR, "index", f"{_sha256(url.encode())}.json")
+
+
+def _blob_path(content_sha):
+    return os.path.join(CACHE_DIR, "blobs", content_sha[:2], f"{content_sha}.html.gz")
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_entry(url):
+    path = _index_path(url)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        entry = json.load(f)
+    if not os.path.exists(_blob_path(entry["content_sha"])):
+        return None
+    return entry
+
+
+def read_body(entry):
+    with gzip.open(_blob_path(entry["content_sha"]), "rb") as f:
+        return f.read()
+
+
+def store(url, body, etag=None, last_modified=None):
+    """
+    Save a page body (deduplicated by content hash) and point the URL's index entry at it.
+    """
+    content_sha = _sha256(body)
+    blob_path = _blob_path(content_sha)
+    if not os.path.exists(blob_path):
+        _atomic_write(blob_path, gzip.compress(body))
+
+    entry = {
+        "url": url,
+        "content_sha": content_sha,
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": datetime.utcnow().isoformat()
+    }
+    _atomic_write(_index_path(url), json.dumps(entry).encode())
+    return entry
+
+
+def fetch_with_cache(session, url, timeout=10):
+    """
+    Conditional GET against the cached validators.
+    Returns (state, body) where state is "fresh", "unchanged" or "not_modified".
+    """
+    entry = load_entry(url)
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and entry:
+        return "not_modified", read_body(entry)
+    response.raise_for_status()
+
+    body = response.content
+    unchanged = entry is not None and entry["content_sha"] == _sha256(body)
+    store(url, body, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return ("unchanged" if unchanged else "fresh"), body
@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from services.db import get_db_connection
+from services.jobs import report_progress
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _mark(table, where="TRUE"):
+    # Row count plus highest id: changes whenever rows are added or leave the filter
+    return f"(SELECT COUNT(*) || ':' || COALESCE(MAX(id), 0) FROM {table} WHERE {where})"
+
+
+def _run_scrape():
+    from services.quote_scraper import save_quotes_to_postgres_from_links
+    return save_quotes_to_postgres_from_links()
+
+
+def _run_structure():
+    from routers.structure import structure_quotes
+    return structure_quotes(stream=True)
+
+
+def _run_images():
+    from services.image_downloader import download_and_upload_author_images
+    return download_and_upload_author_images()
+
+
+def _run_azure_submit():
+    from services.azure_batch import generate_and_upload_batch
+    return generate_and_upload_batch()
+
+
+def _run_image_alt():
+    from services.azure_image_batch import generate_and_upload_image_alt_batch
+    return generate_and_upload_image_alt_batch()
+
+
+def _run_fetch():
+    from services.fetch import fetch_and_store_pending_batches
+    return fetch_and_store_pending_batches()
+
+
+def _run_merge():
+    from services.merge_handler import merge_textual_data
+    return merge_textual_data()
+
+
+def _run_match():
+    from services.alttxtmatch import match_alttxt_and_store
+    return match_alttxt_and_store()
+
+
+def _run_resize():
+    from services.resizer import generate_resized_urls
+    return generate_resized_urls()
+
+
+def _run_cdn_warm():
+    from services.cdn_warmer import warm_settings, warm_resized_urls
+    if not warm_settings()["enabled"]:
+        return {"status": "disabled", "message": "Set CDN_WARM_ENABLED to warm resize URLs."}
+    return warm_resized_urls()
+
+
+def _run_distribute():
+    from services.distribute import distribute_urls
+    return distribute_urls()
+
+
+def _run_video_meta():
+    from services.videosheetadd import assign_video_metadata
+    return assign_video_metadata()
+
+
+def _run_clean():
+    from services.removal import clean_video_metadata_table
+    return {"message": clean_video_metadata_table()}
+
+
+def _run_metadata():
+    from services.metadata_generator import generate_meta_data
+    return generate_meta_data()
+
+
+def _run_rotate():
+    from routers.rotate import rotate_meta_data
+    return rotate_meta_data()
+
+
+def _run_reorder():
+    from routers.reorder import reorder_and_clean_data
+    return reorder_and_clean_data()
+
+
+# name: (callable, upstream stages, watermark SQL or None to always run)
+# Stages that only drain part of their input per call must not have a watermark.
+STAGES = {
+    "scrape": (_run_scrape, [], None),
+    "structure": (_run_structure, ["scrape"],
+                  _mark("quote_scraped_data", "text_structure_status = 'Pending'")),
+    # Drains one scrape_id per call, so an unchanged backlog still needs another run
+    "images": (_run_images, ["scrape"], None),
+    "azure_submit": (_run_azure_submit, ["structure"],
+                     _mark("template1_text_structure_data", "batch_created IS NOT TRUE")),
+    "image_alt": (_run_image_alt, ["images"],
+                  _mark("image_fetched_data", "batch_created IS NOT TRUE")),
+    "fetch": (_run_fetch, ["azure_submit", "image_alt"], None),
+    "merge": (_run_merge, ["fetch"],
+              _mark("template1_text_batch_processed_data") + " || '/' || " + _mark("template1_text_structure_data")),
+    "match": (_run_match, ["fetch"],
+              _mark("image_batch_processed_data") + " || '/' || " + _mark("image_fetched_data")),
+    "resize": (_run_resize, ["match"],
+               _mark("alttxt_processed_data", "status_resizer = false")),
+    "cdn_warm": (_run_cdn_warm, ["resize"],
+                 _mark("resized_url_data", "cdn_warmed IS NOT TRUE")),
+    "distribute": (_run_distribute, ["merge", "resize"],
+                   _mark("textual_structured_data") + " || '/' || " + _mark("resized_url_data")),
+    "video_meta": (_run_video_meta, ["distribute"],
+                   _mark("distribution_data") + " || '/' || " + _mark("video_metadata")),
+    "clean": (_run_clean, ["video_meta"], _mark("video_meta_added_table")),
+    "metadata": (_run_metadata, ["clean"],
+                 _mark("cleaned_video_meta", "meta_data_added = FALSE")),
+    "rotate": (_run_rotate, ["metadata"], _mark("meta_data")),
+    "reorder": (_run_reorder, ["rotate"], _mark("pre_final_stage_data")),
+}
+
+
+def ensure_pipeline_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            id SERIAL PRIMARY KEY,
+            run_id TEXT UNIQUE,
+            status TEXT,
+            force BOOLEAN DEFAULT FALSE,
+            started_at TIMESTAMPTZ DEFAULT NOW(),
+            finished_at TIMESTAMPTZ,
+            duration_seconds DOUBLE PRECISION
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_stage_runs (
+            id SERIAL PRIMARY KEY,
+            run_id TEXT,
+            stage TEXT,
+            status TEXT,
+            watermark TEXT,
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            duration_seconds DOUBLE PRECISION,
+            detail TEXT
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pipeline_stage_runs_stage
+        ON pipeline_stage_runs (stage, id DESC);
+    """)
+
+
+def read_watermark(stage):
+    """
+    Current input watermark of a stage, or None when it has none (or its tables don't exist yet).
+    """
+    sql = STAGES[stage][2]
+    if sql is None:
+        return None
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {sql};")
+            value = cur.fetchone()[0]
+            cur.close()
+            return value
+    except Exception:
+        return None
+
+
+def last_watermark(stage):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT watermark FROM pipeline_stage_runs
+            WHERE stage = %s AND status IN ('success', 'skipped')
+            ORDER BY id DESC
+            LIMIT 1;
+        """, (stage,))
+        row = cur.fetchone()
+        cur.close()
+        return row[0] if row else None
+
+
+def _record_stage(run_id, stage, status, watermark, started_at, duration, detail):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO pipeline_stage_runs (
+                run_id, stage, status, watermark, started_at, finished_at, duration_seconds, detail
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+        """, (
+            run_id, stage, status, watermark, started_at, datetime.utcnow(),
+            round(duration, 3), json.dumps(detail, default=str)[:10000]
+        ))
+        conn.commit()
+        cur.close()
+
+
+def run_stage(run_id, stage, force=False):
+    """
+    Run one stage unless its input watermark is unchanged since its last successful run.
+    The watermark stored is the one read after the stage ran, i.e. what it left behind.
+    Stages reporting status "partial" do not block downstream stages but store no watermark.
+    """
+    started_at = datetime.utcnow()
+    start = time.perf_counter()
+
+    watermark = read_watermark(stage)
+    if not force and watermark is not None and watermark == last_watermark(stage):
+        _record_stage(run_id, stage, "skipped", watermark, started_at, time.perf_counter() - start,
+                      {"reason": "watermark unchanged"})
+        return {"stage": stage, "status": "skipped", "duration_seconds": round(time.perf_counter() - start, 3)}
+
+    try:
+        result = STAGES[stage][0]()
+        if hasattr(result, "body"):
+            # Router functions may hand back a JSONResponse
+            result = json.loads(result.body)
+        outcome = result.get("status") if isinstance(result, dict) else None
+        status = {"error": "failed", "partial": "partial"}.get(outcome, "success")
+    except Exception as e:
+        result = {"detail": getattr(e, "detail", str(e))}
+        status = "failed"
+
+    duration = time.perf_counter() - start
+    # A partial run left work behind its watermark: store none so the next run retries it
+    watermark = read_watermark(stage) if status == "success" else None
+    _record_stage(run_id, stage, status, watermark, started_at, duration, result)
+    return {"stage": stage, "status": status, "duration_seconds": round(duration, 3), "result": result}
+
+
+def run_pipeline(force=False, max_parallel=None):
+    """
+    Run the whole DAG, starting each stage as soon as all of its upstream stages are done,
+    so the text and image branches overlap. Stages downstream of a failure are blocked.
+    """
+    max_parallel = max_parallel or int(os.getenv("PIPELINE_MAX_PARALLEL", "4"))
+    run_id = str(uuid.uuid4())
+    run_start = time.perf_counter()
+
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        ensure_pipeline_tables(cur)
+        cur.execute("""
+            INSERT INTO pipeline_runs (run_id, status, force, started_at)
+            VALUES (%s, %s, %s, %s);
+        """, (run_id, "running", force, datetime.utcnow()))
+        conn.commit()
+        cur.close()
+
+    results, running = {}, {}
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while len(results) < len(STAGES):
+            for stage, (_, upstream, _) in STAGES.items():
+                if stage in results or stage in running.values():
+                    continue
+                if any(results.get(u, {}).get("status") in ("failed", "blocked") for u in upstream):
+                    results[stage] = {"stage": stage, "status": "blocked"}
+                    _record_stage(run_id, stage, "blocked", None, datetime.utcnow(), 0, {"upstream": upstream})
+                elif all(u in results for u in upstream):
+                    running[executor.submit(run_stage, run_id, stage, force)] = stage
+
+            if not running:
+                continue
+            report_progress(run_id=run_id, finished=len(results), total=len(STAGES), running=sorted(running.values()))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage] = future.result()
+                except Exception as e:
+                    results[stage] = {"stage": stage, "status": "failed", "result": {"detail": str(e)}}
+
+    duration = time.perf_counter() - run_start
+    stage_statuses = {r["status"] for r in results.values()}
+    if stage_statuses & {"failed", "blocked"}:
+        status = "failed"
+    else:
+        status = "partial" if "partial" in stage_statuses else "success"
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE pipeline_runs
+            SET status = %s, finished_at = %s, duration_seconds = %s
+            WHERE run_id = %s;
+        """, (status, datetime.utcnow(), round(duration, 3), run_id))
+        conn.commit()
+        cur.close()
+
+    return {
+        "status": status,
+        "run_id": run_id,
+        "duration_seconds": round(duration, 3),
+        "stages": [results[stage] for stage in STAGES]
+    }
+
+
+def list_pipeline_runs(limit=20):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        ensure_pipeline_tables(cur)
+        conn.commit()
+        cur.execute("""
+            SELECT run_id, status, force, started_at, finished_at, duration_seconds
+            FROM pipeline_runs
+            ORDER BY id DESC
+            LIMIT %s;
+        """, (limit,))
+        columns = [desc[0] for desc in cur.description]
+        runs = [dict(zip(columns, row)) for row in cur.fetchall()]
+        cur.close()
+        return runs
+
+
+def get_pipeline_run(run_id):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        ensure_pipeline_tables(cur)
+        conn.commit()
+        cur.execute("""
+            SELECT run_id, status, force, started_at, finished_at, duration_seconds
+            FROM pipeline_runs WHERE run_id = %s;
+        """, (run_id,))
+        row = cur.fetchone()
+        if not row:
+            cur.close()
+            return None
+        run = dict(zip([desc[0] for desc in cur.description], row))
+
+        cur.execute("""
+            SELECT stage, status, watermark, started_at, finished_at, duration_seconds, detail
+            FROM pipeline_stage_runs
+            WHERE run_id = %s
+            ORDER BY id;
+        """, (run_id,))
+        columns = [desc[0] for desc in cur.description]
+        run["stages"] = [dict(zip(columns, r)) for r in cur.fetchall()]
+        cur.close()
+        return run
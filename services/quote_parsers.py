@@ -0,0 +1,199 @@
+import os
+from urllib.parse import urljoin
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_URL = "https://quotefancy.com"
+
+
+def _clean_author(text):
+    return text.replace("by ", "").strip()
+
+
+def parse_with_html_parser(body):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(body, "html.parser")
+    containers = soup.find_all("div", class_="q-wrapper")
+    records = []
+
+    for container in containers:
+        quote_div = container.find("div", class_="quote-a")
+        quote_text = quote_div.get_text(strip=True) if quote_div \
+            else container.find("a", class_="quote-a").get_text(strip=True)
+
+        quote_link = ""
+        if quote_div and quote_div.find("a"):
+            quote_link = quote_div.find("a").get("href", "")
+        elif container.find("a", class_="quote-a"):
+            quote_link = container.find("a", class_="quote-a").get("href", "")
+        quote_link = urljoin(BASE_URL, quote_link)
+
+        author_div = container.find("div", class_="author-p bylines")
+        if author_div:
+            author_text = _clean_author(author_div.get_text(strip=True))
+        else:
+            author_p = container.find("p", class_="author-p")
+            author_text = author_p.find("a").get_text(strip=True) if author_p and author_p.find("a") else "Anonymous"
+
+        records.append({
+            "quote": quote_text,
+            "link": quote_link,
+            "author": author_text
+        })
+
+    return records
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_lxml_selectors = None
+
+
+def _compiled_lxml_selectors():
+    # Compiled once per process and reused for every page
+    global _lxml_selectors
+    if _lxml_selectors is None:
+        from lxml import etree
+        _lxml_selectors = {
+            "containers": etree.XPath(f"//div[{_has_class('q-wrapper')}]"),
+            "quote_div": etree.XPath(f".//div[{_has_class('quote-a')}]"),
+            "quote_a": etree.XPath(f".//a[{_has_class('quote-a')}]"),
+            "first_a": etree.XPath(".//a"),
+            "author_div": etree.XPath(".//div[@class='author-p bylines']"),
+            "author_p": etree.XPath(f".//p[{_has_class('author-p')}]"),
+        }
+    return _lxml_selectors
+
+
+def _lxml_text(element):
+    return "".join(text.strip() for text in element.itertext() if text.strip())
+
+
+def _first(selector, element):
+    found = selector(element)
+    return found[0] if found else None
+
+
+def parse_with_lxml(body):
+    import lxml.html
+
+    if not body or not body.strip():
+        return []
+    sel = _compiled_lxml_selectors()
+    if isinstance(body, bytes):
+        # Without a <meta charset> lxml would fall back to Latin-1; pages are UTF-8 like the other backends assume
+        root = lxml.html.fromstring(body, parser=lxml.html.HTMLParser(encoding="utf-8"))
+    else:
+        root = lxml.html.fromstring(body)
+    records = []
+
+    for container in sel["containers"](root):
+        quote_div = _first(sel["quote_div"], container)
+        quote_a = _first(sel["quote_a"], container)
+        quote_text = _lxml_text(quote_div) if quote_div is not None else _lxml_text(quote_a)
+
+        quote_link = ""
+        inner_a = _first(sel["first_a"], quote_div) if quote_div is not None else None
+        if inner_a is not None:
+            quote_link = inner_a.get("href", "")
+        elif quote_a is not None:
+            quote_link = quote_a.get("href", "")
+        quote_link = urljoin(BASE_URL, quote_link)
+
+        author_div = _first(sel["author_div"], container)
+        if author_div is not None:
+            author_text = _clean_author(_lxml_text(author_div))
+        else:
+            author_p = _first(sel["author_p"], container)
+            author_a = _first(sel["first_a"], author_p) if author_p is not None else None
+            author_text = _lxml_text(author_a) if author_a is not None else "Anonymous"
+
+        records.append({
+            "quote": quote_text,
+            "link": quote_link,
+            "author": author_text
+        })
+
+    return records
+
+
+def _selectolax_text(node):
+    return node.text(deep=True, separator="", strip=True)
+
+
+def parse_with_selectolax(body):
+    # Lexbor backend: selectolax 1.x removed the Modest-based selectolax.parser
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(body)
+    records = []
+
+    for container in tree.css("div.q-wrapper"):
+        quote_div = container.css_first("div.quote-a")
+        quote_a = container.css_first("a.quote-a")
+        quote_text = _selectolax_text(quote_div) if quote_div is not None else _selectolax_text(quote_a)
+
+        quote_link = ""
+        inner_a = quote_div.css_first("a") if quote_div is not None else None
+        if inner_a is not None:
+            quote_link = inner_a.attributes.get("href") or ""
+        elif quote_a is not None:
+            quote_link = quote_a.attributes.get("href") or ""
+        quote_link = urljoin(BASE_URL, quote_link)
+
+        author_div = container.css_first('div[class="author-p bylines"]')
+        if author_div is not None:
+            author_text = _clean_author(_selectolax_text(author_div))
+        else:
+            author_a = container.css_first("p.author-p a")
+            author_text = _selectolax_text(author_a) if author_a is not None else "Anonymous"
+
+        records.append({
+            "quote": quote_text,
+            "link": quote_link,
+            "author": author_text
+        })
+
+    return records
+
+
+PARSER_BACKENDS = {
+    "html.parser": parse_with_html_parser,
+    "lxml": parse_with_lxml,
+    "selectolax": parse_with_selectolax,
+}
+
+
+def parser_settings():
+    return {
+        "backend": os.getenv("QUOTE_PARSER_BACKEND", "html.parser"),
+        "processes": int(os.getenv("QUOTE_PARSE_PROCESSES", "0")),
+    }
+
+
+def get_parser(backend=None):
+    backend = backend or parser_settings()["backend"]
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend} (choose from {', '.join(PARSER_BACKENDS)})")
+    return PARSER_BACKENDS[backend]
+
+
+def parse_quote_page(body, backend=None):
+    return get_parser(backend)(body)
+
+
+def pooled_parser(executor, backend=None):
+    """
+    Page parser that hands each page to a process pool; blocks the calling fetch thread
+    until that page is parsed so stop-on-empty still works page by page.
+    """
+    parse = get_parser(backend)
+
+    def parse_in_pool(body):
+        return executor.submit(parse, body).result()
+
+    return parse_in_pool
@@ -1,11 +1,18 @@
-import time
+import io
+import csv
+import multiprocessing
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin
-import psycopg2
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from urllib.parse import urlparse
+from services.db import get_db_connection
 import os
 import uuid
 from dotenv import load_dotenv
+from services.rate_limiter import HostRateLimiter
+from services import page_cache
+from services.quote_parsers import get_parser, pooled_parser, parser_settings
 
 # Load .env credentials
 load_dotenv()
@@ -15,8 +22,20 @@ def extract_slug_from_url(url):
     path = parsed.path.strip("/")
     return path.split("/")[0] if path else ""
 
-def create_session():
+def scraper_settings():
+    return {
+        "max_workers": int(os.getenv("QUOTE_SCRAPE_WORKERS", "8")),
+        "requests_per_second": float(os.getenv("QUOTE_SCRAPE_RATE", "2")),
+        "burst": float(os.getenv("QUOTE_SCRAPE_BURST", "2")),
+        "max_attempts": int(os.getenv("QUOTE_SCRAPE_MAX_ATTEMPTS", "5")),
+    }
+
+def create_session(pool_size=10):
     session = requests.Session()
+    # Keep-alive connections shared by every worker thread
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
     session.headers.update({
         "User-Agent": (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -26,137 +45,331 @@ def create_session():
     })
     return session
 
-def scrape_quotes_for_slug(slug, max_pages=10):
-    session = create_session()
+def scrape_quotes_for_slug(slug, max_pages=10, session=None, limiter=None,
+                           start_page=1, ingested_through=0, offline=False, parser=None):
+    """
+    Scrape quotefancy pages for a slug starting at `start_page`.
+    Pages up to `ingested_through` are already stored, so a 304 (or identical body) for them
+    skips parsing. With offline=True pages are read only from the local page cache.
+    `parser` turns a page body into quote records (see services.quote_parsers).
+    Returns {"quotes", "last_page", "completed", "error"}.
+    """
+    if session is None and not offline:
+        session = create_session()
+    if limiter is None and not offline:
+        settings = scraper_settings()
+        limiter = HostRateLimiter(settings["requests_per_second"], settings["burst"])
+    if parser is None:
+        parser = get_parser()
     quotes = []
     serial_number = 1
+    last_page = start_page - 1
+    completed = True
+    error = None
 
-    for page_number in range(1, max_pages + 1):
+    for page_number in range(start_page, max_pages + 1):
         url = f"https://quotefancy.com/{slug}/page/{page_number}"
-        try:
-            response = session.get(url, timeout=10)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            print(f"[ERROR] Page fetch failed: {url} -> {e}")
-            break
 
-        soup = BeautifulSoup(response.content, "html.parser")
-        containers = soup.find_all("div", class_="q-wrapper")
-        if not containers:
+        if offline:
+            entry = page_cache.load_entry(url)
+            if entry is None:
+                break
+            body = page_cache.read_body(entry)
+        else:
+            # Politeness is enforced per host by the token bucket instead of a fixed sleep
+            limiter.wait(url)
+            try:
+                state, body = page_cache.fetch_with_cache(session, url)
+            except requests.HTTPError as e:
+                # A missing page means the slug has no more pages
+                if e.response is not None and e.response.status_code == 404:
+                    break
+                print(f"[ERROR] Page fetch failed: {url} -> {e}")
+                completed, error = False, str(e)
+                break
+            except requests.RequestException as e:
+                print(f"[ERROR] Page fetch failed: {url} -> {e}")
+                completed, error = False, str(e)
+                break
+
+            if state != "fresh" and page_number <= ingested_through:
+                last_page = page_number
+                continue
+
+        records = parser(body)
+        if not records:
             break
 
-        for container in containers:
-            quote_div = container.find("div", class_="quote-a")
-            quote_text = quote_div.get_text(strip=True) if quote_div \
-                else container.find("a", class_="quote-a").get_text(strip=True)
-
-            quote_link = ""
-            if quote_div and quote_div.find("a"):
-                quote_link = quote_div.find("a").get("href", "")
-            elif container.find("a", class_="quote-a"):
-                quote_link = container.find("a", class_="quote-a").get("href", "")
-            quote_link = urljoin("https://quotefancy.com", quote_link)
-
-            author_div = container.find("div", class_="author-p bylines")
-            if author_div:
-                author_text = author_div.get_text(strip=True).replace("by ", "").strip()
-            else:
-                author_p = container.find("p", class_="author-p")
-                author_text = author_p.find("a").get_text(strip=True) if author_p and author_p.find("a") else "Anonymous"
-
-            quotes.append({
-                "serial": serial_number,
-                "quote": quote_text,
-                "link": quote_link,
-                "author": author_text
-            })
+        for record in records:
+            quotes.append({"serial": serial_number, **record})
             serial_number += 1
+        last_page = page_number
 
-        time.sleep(1)
+    return {"quotes": quotes, "last_page": last_page, "completed": completed, "error": error}
 
-    return quotes
+def merge_quote_batch(cur, page_id, page_link, quotes, scrape_id, text_structure_id):
+    """
+    Stage one page batch with COPY and merge it into quote_scraped_data in a single statement.
+    Returns (inserted, deduplicated).
+    """
+    if not quotes:
+        return 0, 0
 
-def save_quotes_to_postgres_from_links():
-    conn = psycopg2.connect(
-        host=os.getenv("PG_HOST"),
-        database=os.getenv("PG_DATABASE"),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD"),
-        port=os.getenv("PG_PORT")
-    )
-    cur = conn.cursor()
+    buffer = io.StringIO()
+    # Quote every field: COPY reads an unquoted empty field as NULL, a quoted one as ''
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for q in quotes:
+        writer.writerow([page_id, q["quote"], q["author"], q["link"], page_link])
+    buffer.seek(0)
 
-    # Create table if it doesn't exist
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS quote_scraped_data (
-            id SERIAL PRIMARY KEY,
+        CREATE TEMP TABLE IF NOT EXISTS quote_scraped_stage (
             page_id INTEGER,
-            quote TEXT NOT NULL,
+            quote TEXT,
             author_name TEXT,
             quote_link TEXT,
-            page_link TEXT,
-            scrape_id TEXT,
-            text_structure_status TEXT DEFAULT 'Pending',
-            text_structure_id TEXT,
-            author_image_check TEXT DEFAULT 'Unchecked',
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE (quote, author_name)
+            page_link TEXT
         );
     """)
+    cur.execute("TRUNCATE quote_scraped_stage;")
+    cur.copy_expert("""
+        COPY quote_scraped_stage (page_id, quote, author_name, quote_link, page_link)
+        FROM STDIN WITH (FORMAT csv);
+    """, buffer)
 
-    # Fetch 15 pages to scrape
     cur.execute("""
-        SELECT page_id, page_link
-        FROM qoutefancy_page_links 
-        WHERE scraped_status = false
-        LIMIT 15;
+        WITH inserted AS (
+            INSERT INTO quote_scraped_data (
+                page_id, quote, author_name, quote_link, page_link,
+                scrape_id, text_structure_status, text_structure_id,
+                author_image_check, timestamp
+            )
+            SELECT page_id, quote, author_name, quote_link, page_link,
+                   %s, 'Pending', %s, 'Unchecked', NOW()
+            FROM quote_scraped_stage
+            ON CONFLICT (quote, author_name) DO NOTHING
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM inserted;
+    """, (scrape_id, text_structure_id))
+    inserted = cur.fetchone()[0]
+    return inserted, len(quotes) - inserted
+
+def ensure_progress_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS quotefancy_slug_progress (
+            slug TEXT PRIMARY KEY,
+            page_link TEXT,
+            last_page INTEGER DEFAULT 0,
+            completed BOOLEAN DEFAULT FALSE,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        ALTER TABLE quotefancy_slug_progress
+        ADD COLUMN IF NOT EXISTS failed_attempts INTEGER DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS last_error TEXT;
     """)
-    pages = cur.fetchall()
 
-    if not pages:
-        print("No new pages to scrape.")
-        return
+def load_slug_progress(cur, slugs):
+    cur.execute("""
+        SELECT slug, last_page, completed
+        FROM quotefancy_slug_progress
+        WHERE slug = ANY(%s);
+    """, (list(slugs),))
+    return {slug: (last_page, completed) for slug, last_page, completed in cur.fetchall()}
+
+def save_slug_progress(cur, slug, page_link, last_page, completed, error=None):
+    # A failed fetch counts an attempt; a completed run resets the count
+    cur.execute("""
+        INSERT INTO quotefancy_slug_progress (
+            slug, page_link, last_page, completed, failed_attempts, last_error, updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (slug) DO UPDATE
+        SET page_link = EXCLUDED.page_link,
+            last_page = GREATEST(quotefancy_slug_progress.last_page, EXCLUDED.last_page),
+            completed = EXCLUDED.completed,
+            failed_attempts = CASE WHEN EXCLUDED.completed THEN 0
+                                   ELSE COALESCE(quotefancy_slug_progress.failed_attempts, 0) + 1 END,
+            last_error = EXCLUDED.last_error,
+            updated_at = NOW();
+    """, (slug, page_link, last_page, completed, 0 if completed else 1, error))
+
+def touch_slug_progress(cur, slug, page_link):
+    # Offline re-parses only move the slug to the back of the least-recently-checked order
+    cur.execute("""
+        INSERT INTO quotefancy_slug_progress (slug, page_link, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (slug) DO UPDATE
+        SET updated_at = NOW();
+    """, (slug, page_link))
+
+def save_quotes_to_postgres_from_links(batch_size=15, max_workers=None, requests_per_second=None,
+                                       revisit=False, offline=False, parser_backend=None, parse_processes=None):
+    """
+    Scrape the next batch of qoutefancy_page_links and merge the quotes.
 
-    # Generate a single UUID for this batch
-    text_structure_id = str(uuid.uuid4())
-    scrape_id = text_structure_id  # ✅ Set scrape_id same as text_structure_id
-    print(f"🔗 Batch ID (scrape_id = text_structure_id): {scrape_id}")
+    Progress is committed per slug, so an interrupted run resumes after the last stored page.
+    revisit=True re-checks already scraped links with conditional GETs, and offline=True
+    re-parses them from the local page cache without any network traffic.
+    parse_processes > 0 parses pages on a process pool with the chosen parser backend.
+    """
+    settings = scraper_settings()
+    parse_config = parser_settings()
+    parser_backend = parser_backend or parse_config["backend"]
+    parse_processes = parse_config["processes"] if parse_processes is None else parse_processes
+    max_workers = max_workers or settings["max_workers"]
+    requests_per_second = requests_per_second or settings["requests_per_second"]
 
-    for page_id, page_link in pages:
-        slug = extract_slug_from_url(page_link)
-        quotes = scrape_quotes_for_slug(slug, max_pages=10)
+    with get_db_connection() as conn:
+        cur = conn.cursor()
 
-        for q in quotes:
+        # Create table if it doesn't exist
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS quote_scraped_data (
+                id SERIAL PRIMARY KEY,
+                page_id INTEGER,
+                quote TEXT NOT NULL,
+                author_name TEXT,
+                quote_link TEXT,
+                page_link TEXT,
+                scrape_id TEXT,
+                text_structure_status TEXT DEFAULT 'Pending',
+                text_structure_id TEXT,
+                author_image_check TEXT DEFAULT 'Unchecked',
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (quote, author_name)
+            );
+        """)
+        ensure_progress_table(cur)
+        conn.commit()
+
+        if revisit or offline:
+            # Least recently checked links first
+            cur.execute("""
+                SELECT l.page_id, l.page_link
+                FROM qoutefancy_page_links l
+                LEFT JOIN quotefancy_slug_progress p ON p.page_link = l.page_link
+                WHERE l.scraped_status = true
+                ORDER BY p.updated_at NULLS FIRST
+                LIMIT %s;
+            """, (batch_size,))
+        else:
+            # Fetch the next batch of pages to scrape; links that kept failing are left out
             cur.execute("""
-                INSERT INTO quote_scraped_data (
-                    page_id, quote, author_name, quote_link, page_link,
-                    scrape_id, text_structure_status, text_structure_id,
-                    author_image_check, timestamp
+                SELECT l.page_id, l.page_link
+                FROM qoutefancy_page_links l
+                LEFT JOIN quotefancy_slug_progress p ON p.page_link = l.page_link
+                WHERE l.scraped_status = false
+                  AND COALESCE(p.failed_attempts, 0) < %s
+                ORDER BY COALESCE(p.failed_attempts, 0)
+                LIMIT %s;
+            """, (settings["max_attempts"], batch_size))
+        pages = cur.fetchall()
+
+        if not pages:
+            print("No new pages to scrape.")
+            return {"pages_scraped": 0, "quotes_scraped": 0, "rows_inserted": 0, "rows_deduplicated": 0}
+
+        # Generate a single UUID for this batch
+        text_structure_id = str(uuid.uuid4())
+        scrape_id = text_structure_id  # ✅ Set scrape_id same as text_structure_id
+        print(f"🔗 Batch ID (scrape_id = text_structure_id): {scrape_id}")
+
+        slugs = {page_id: extract_slug_from_url(page_link) for page_id, page_link in pages}
+        progress = load_slug_progress(cur, slugs.values())
+
+        session = None if offline else create_session(pool_size=max_workers)
+        limiter = None if offline else HostRateLimiter(requests_per_second, settings["burst"])
+        scraped_page_ids = []
+        resumed_slugs = 0
+        total_quotes = 0
+        total_inserted = 0
+        total_deduplicated = 0
+
+        # ✅ Scrape slugs concurrently; DB writes stay on this thread as results arrive
+        with ExitStack() as stack:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+            if parse_processes > 0:
+                # Spawned workers: forking would copy the poller, event-loop and job threads and DB sockets
+                parse_pool = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=parse_processes, mp_context=multiprocessing.get_context("spawn")
+                ))
+                parser = pooled_parser(parse_pool, parser_backend)
+            else:
+                parser = get_parser(parser_backend)
+
+            futures = {}
+            for page_id, page_link in pages:
+                slug = slugs[page_id]
+                last_page, completed = progress.get(slug, (0, False))
+
+                if completed and not (revisit or offline):
+                    # Finished by an interrupted run before its status flip
+                    scraped_page_ids.append(page_id)
+                    continue
+
+                if revisit or offline:
+                    start_page = 1
+                else:
+                    start_page = last_page + 1
+                    resumed_slugs += 1 if last_page else 0
+
+                future = executor.submit(
+                    scrape_quotes_for_slug, slug, 10, session, limiter,
+                    start_page, last_page, offline, parser
                 )
-                VALUES (
-                    %s, %s, %s, %s, %s, %s, 'Pending', %s, 'Unchecked', NOW()
+                futures[future] = (page_id, page_link)
+
+            scraped = ((futures[f], f.result()) for f in as_completed(futures))
+
+            for (page_id, page_link), result in scraped:
+                quotes = result["quotes"]
+                inserted, deduplicated = merge_quote_batch(
+                    cur, page_id, page_link, quotes, scrape_id, text_structure_id
                 )
-                ON CONFLICT (quote, author_name) DO NOTHING;
-            """, (
-                page_id,
-                q["quote"],
-                q["author"],
-                q["link"],
-                page_link,
-                scrape_id,
-                text_structure_id
-            ))
-
-        # ✅ Mark the page as scraped
+                if offline:
+                    touch_slug_progress(cur, slugs[page_id], page_link)
+                else:
+                    save_slug_progress(
+                        cur, slugs[page_id], page_link, result["last_page"], result["completed"], result["error"]
+                    )
+                # ✅ Commit per slug so a crash keeps every stored page
+                conn.commit()
+
+                if result["completed"]:
+                    scraped_page_ids.append(page_id)
+                total_quotes += len(quotes)
+                total_inserted += inserted
+                total_deduplicated += deduplicated
+                print(f"✅ {len(quotes)} quotes from {page_link}: {inserted} new, {deduplicated} duplicates")
+
+        # ✅ Mark all finished pages of this batch as scraped in one statement
         cur.execute("""
             UPDATE qoutefancy_page_links
             SET scraped_status = true
-            WHERE page_id = %s;
-        """, (page_id,))
+            WHERE page_id = ANY(%s);
+        """, (scraped_page_ids,))
+
+        cur.execute("""
+            SELECT COUNT(*)
+            FROM qoutefancy_page_links l
+            JOIN quotefancy_slug_progress p ON p.page_link = l.page_link
+            WHERE l.scraped_status = false AND p.failed_attempts >= %s;
+        """, (settings["max_attempts"],))
+        pages_given_up = cur.fetchone()[0]
 
-        print(f"✅ {len(quotes)} quotes saved from: {page_link}")
+        conn.commit()
+        cur.close()
+        print(f"🚀 Batch scraping completed for {len(pages)} pages.")
 
-    conn.commit()
-    cur.close()
-    conn.close()
-    print("🚀 Batch scraping completed for 15 pages.")
\ No newline at end of file
+        return {
+            "pages_scraped": len(scraped_page_ids),
+            "pages_incomplete": len(pages) - len(scraped_page_ids),
+            "pages_given_up": pages_given_up,
+            "slugs_resumed": resumed_slugs,
+            "quotes_scraped": total_quotes,
+            "rows_inserted": total_inserted,
+            "rows_deduplicated": total_deduplicated
+        }
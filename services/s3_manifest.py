@@ -0,0 +1,41 @@
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def ensure_manifest_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS s3_upload_manifest (
+            s3_key TEXT PRIMARY KEY,
+            content_sha TEXT,
+            size_bytes BIGINT,
+            uploaded_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+
+
+def load_manifest(cur, prefixes):
+    """
+    {s3_key: content_sha} for every object already uploaded under the given key prefixes.
+    """
+    cur.execute("""
+        SELECT s3_key, content_sha FROM s3_upload_manifest
+        WHERE s3_key LIKE ANY(%s);
+    """, ([f"{prefix}%" for prefix in prefixes],))
+    return dict(cur.fetchall())
+
+
+def record_uploads(cur, rows):
+    """
+    rows: [(s3_key, content_sha, size_bytes)]
+    """
+    if rows:
+        execute_values(cur, """
+            INSERT INTO s3_upload_manifest (s3_key, content_sha, size_bytes, uploaded_at)
+            VALUES %s
+            ON CONFLICT (s3_key) DO UPDATE
+            SET content_sha = EXCLUDED.content_sha,
+                size_bytes = EXCLUDED.size_bytes,
+                uploaded_at = EXCLUDED.uploaded_at;
+        """, rows, template="(%s, %s, %s, NOW())")
@@ -0,0 +1,142 @@
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services import cdn_warmer
+from services.resizer import CDN_PREFIX_MEDIA, RESIZE_PRESETS
+
+BODY = b"x" * 2048
+
+
+class StandInCDN(BaseHTTPRequestHandler):
+    """Serves every path except those under /fail/, which answer 503."""
+
+    def do_GET(self):
+        failed = self.path.startswith("/fail/")
+        body = b"unavailable" if failed else BODY
+        self.send_response(503 if failed else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in_cdn(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInCDN)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("CDN_WARM_BASE_URL", f"http://127.0.0.1:{server.server_port}/")
+    monkeypatch.setenv("CDN_WARM_CONCURRENCY", "4")
+    monkeypatch.setenv("CDN_WARM_RATE", "0")
+    monkeypatch.setenv("CDN_WARM_TIMEOUT", "5")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def media_url(path):
+    return f"{CDN_PREFIX_MEDIA}{path}"
+
+
+def test_warm_urls_records_per_preset_successes_failures_and_latency(stand_in_cdn):
+    items = [
+        ("row-1", "squarecoverurl", media_url("ok/a")),
+        ("row-1", "standardurl", media_url("ok/b")),
+        ("row-2", "squarecoverurl", media_url("fail/c")),
+        ("row-2", "standardurl", media_url("ok/d")),
+    ]
+
+    stats, failed_keys = cdn_warmer.warm_urls(items)
+
+    assert failed_keys == {"row-2"}
+    assert set(stats) == set(RESIZE_PRESETS)
+    assert stats["squarecoverurl"]["requests"] == 2
+    assert stats["squarecoverurl"]["failures"] == 1
+    assert stats["standardurl"]["requests"] == 2
+    assert stats["standardurl"]["failures"] == 0
+    assert stats["standardurl"]["bytes"] == 2 * len(BODY)
+    for field in ("avg_ms", "p50_ms", "p95_ms", "max_ms"):
+        assert stats["standardurl"][field] >= 0
+    assert stats["standardurl"]["p95_ms"] <= stats["standardurl"]["max_ms"]
+    # Presets with no URLs report counts but no latencies
+    assert stats["landscapecoverurl"]["requests"] == 0
+    assert stats["landscapecoverurl"]["avg_ms"] is None
+
+
+def test_unreachable_host_counts_as_failure(monkeypatch):
+    monkeypatch.setenv("CDN_WARM_BASE_URL", "http://127.0.0.1:9/")
+    monkeypatch.setenv("CDN_WARM_RATE", "0")
+    monkeypatch.setenv("CDN_WARM_TIMEOUT", "1")
+
+    stats, failed_keys = cdn_warmer.warm_urls([("row-1", "standardurl", media_url("ok/a"))])
+
+    assert failed_keys == {"row-1"}
+    assert stats["standardurl"]["failures"] == 1
+
+
+class RecordingCursor:
+    """Answers the warmer's queries from `rows` and records what it writes."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.warmed_ids = None
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if "SET cdn_warmed = TRUE" in sql:
+            self.warmed_ids = sorted(params[0])
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_only_fully_warmed_rows_are_flipped(stand_in_cdn, monkeypatch):
+    presets = list(RESIZE_PRESETS)
+    rows = [
+        (1, *[media_url(f"ok/1-{p}") for p in presets]),
+        (2, *[media_url(f"fail/2-{p}") if p == "squarecoverurl" else media_url(f"ok/2-{p}") for p in presets]),
+        (3, *["ERROR" if p == "nextstoryimageurl" else media_url(f"ok/3-{p}") for p in presets]),
+    ]
+    cur = RecordingCursor(rows)
+    conn = RecordingConnection(cur)
+
+    @contextmanager
+    def connection():
+        yield conn
+
+    monkeypatch.setattr(cdn_warmer, "get_db_connection", connection)
+
+    result = cdn_warmer.warm_resized_urls()
+
+    assert result["status"] == "success"
+    assert cur.warmed_ids == [1, 3]
+    assert result["rows_warmed"] == 2
+    assert result["rows_failed"] == 1
+    # "ERROR" placeholders are never requested
+    assert result["urls_requested"] == 3 * len(presets) - 1
+    assert result["presets"]["squarecoverurl"]["failures"] == 1
+    assert conn.commits >= 2
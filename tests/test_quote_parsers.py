@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from services.quote_parsers import PARSER_BACKENDS, get_parser
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture(scope="module")
+def page_body():
+    return (FIXTURES / "quotefancy_page.html").read_text(encoding="utf-8")
+
+
+@pytest.fixture(scope="module")
+def golden_records():
+    return json.loads((FIXTURES / "quotefancy_page.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("backend", sorted(PARSER_BACKENDS))
+def test_backend_matches_golden_records(backend, page_body, golden_records):
+    assert get_parser(backend)(page_body) == golden_records
+
+
+@pytest.mark.parametrize("backend", sorted(PARSER_BACKENDS))
+def test_backend_decodes_utf8_bytes_without_meta_charset(backend):
+    # Production hands the parsers raw response/page-cache bytes
+    body = (FIXTURES / "quotefancy_page_utf8.html").read_bytes()
+    golden = json.loads((FIXTURES / "quotefancy_page_utf8.json").read_text(encoding="utf-8"))
+    assert get_parser(backend)(body) == golden
+
+
+@pytest.mark.parametrize("backend", sorted(PARSER_BACKENDS))
+def test_backend_returns_no_records_for_page_without_quotes(backend):
+    assert get_parser(backend)("<html><body><p>No quotes here</p></body></html>") == []
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        get_parser("regex")